@@ -1,20 +1,19 @@
 import vtk
 from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
-from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton)
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QPushButton)
 from PySide6.QtGui import QIcon, QPainterPath, QPainter, QPixmap, QColor, QFont, QFontMetrics, QRegion
 from PySide6.QtCore import QPoint, Qt, QRectF, QEvent, QTimer
 
 from ptb.util.io.helper import BasicIO
 from ptb.util.io.opendialog import OpenFiles
-from ptb.util.data import VTKMeshUtl
 from ptb.util.lang import CommonSymbols
 import os
 import numpy as np
-import copy
 
 from ssm_gui.defaults.widgets import MeshInfoWidget, InfoWidget, AngleInfoWidget
 from ssm_gui.__init__ import resource_path
+from ssm_gui.models.cache import cached_poly
 
 
 class WorldPolyDataHelper:
@@ -54,6 +53,16 @@ class World:
 
 
         self.actors = {}
+        # Frame-coalescing render scheduler, see schedule()
+        self.frame_interval = 16
+        self.pending = {}
+        self.dirty = False
+        self.flushing = False
+        self.render_timer = QTimer()
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(self.frame_interval)
+        self.render_timer.timeout.connect(self.flush)
+
         self.axes = vtk.vtkAxesActor()
         self.axes.SetTotalLength(100, 100, 100)
         self.axes.SetNormalizedTipLength(0.2, 0.2, 0.2)
@@ -106,6 +115,34 @@ class World:
         self.vtk_widget.update()
         self.vtk_widget.focusWidget()
 
+    def schedule(self, key=None, func=None):
+        """
+        Apply the latest update for each key and render, at most once per frame
+        """
+        if func is not None:
+            self.pending[key] = func
+        self.dirty = True
+        if func is None and self.flushing:
+            return
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def request_render(self):
+        self.schedule()
+
+    def flush(self):
+        self.flushing = True
+        pending = self.pending
+        self.pending = {}
+        try:
+            for key in pending:
+                pending[key]()
+        finally:
+            self.flushing = False
+        if self.dirty:
+            self.dirty = False
+            self.update_view()
+
 
     def reset_zoom(self, on_load=False):
         self.ren.ResetCamera()
@@ -176,9 +213,11 @@ class World:
         self.vtk_widget.update()
 
     def copy_actor(self, actor):
+        # the geometry is shared with the original (e.g. the memory mapped cached mesh), arrays of
+        # the actors are replaced rather than modified in place
         poly = actor.GetMapper().GetInput()
         poly_copy = vtk.vtkPolyData()
-        poly_copy.DeepCopy(poly)
+        poly_copy.ShallowCopy(poly)
         mapper = vtk.vtkPolyDataMapper()
         if vtk.VTK_MAJOR_VERSION <= 5:
             mapper.SetInput(poly_copy)
@@ -191,7 +230,8 @@ class World:
         return new_actor
 
 
-    def add_actor(self, actor_name: str = None, actor: vtk.vtkActor = None, filename: str = None):
+    def add_actor(self, actor_name: str = None, actor: vtk.vtkActor = None, filename: str = None,
+                  polydata: vtk.vtkPolyData = None):
         if actor_name is not None and actor is not None:
             self.actors[actor_name] = actor
             self.ren.AddActor(self.actors[actor_name])
@@ -200,7 +240,8 @@ class World:
             if len(path_elements) == 1:
                 path_elements = filename.split("/")
 
-            polydata = VTKMeshUtl.load(filename, clean_mesh=False)
+            if polydata is None:    # not already read (e.g. by the project loader)
+                polydata = cached_poly(filename)
             mapper = vtk.vtkPolyDataMapper()
             if vtk.VTK_MAJOR_VERSION <= 5:
                 mapper.SetInput(polydata)
@@ -956,6 +997,12 @@ class WorldView(QWidget):
     def reset_view_orientation(self):
         self.world.reset_view_orientation()
 
+    def schedule(self, key=None, func=None):
+        self.world.schedule(key, func)
+
+    def request_render(self):
+        self.world.request_render()
+
     def resize_ev(self, k):
         self.model_name_widget.update_pos(k)
         # p = self.model_name_widget.text()
@@ -1183,6 +1230,7 @@ class WorldMenuWidget(QWidget):
     def __init__(self, parent, listener):
         super().__init__(parent)
         self.listener = listener
+        self.root = listener    # MeshInfoWidget loads replacement meshes through root.root.world
         self.setWindowOpacity(0.65)
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.Popup)
         self.blank = QLabel(self)
@@ -1206,7 +1254,11 @@ class WorldMenuWidget(QWidget):
         self.marker_button.setIcon(QIcon("icons/folder-open.png"))
         self.marker_button.setFixedWidth(30)
 
+        self.remove_button = QPushButton("Remove all")
+        self.remove_button.setVisible(False)
+
         self.vl.addStretch(5)
+        self.vl.addWidget(self.remove_button)
         self.setLayout(self.vl)
         self.sheet = BasicIO.read_as_block(resource_path("defaults/drop_menu.qss"))
         self.setStyleSheet(self.sheet)
@@ -1236,18 +1288,25 @@ class WorldMenuWidget(QWidget):
         print(vp)
         self.listener.current_model.update_elbow(vp)
 
+    def set_remove_action(self, handle):
+        self.remove_button.clicked.connect(handle)
+        self.remove_button.setVisible(True)
+
     def updated_meshes(self, mesh_list, append=False):
+        """
+        :param mesh_list: (mesh path, actor name, actor) of each row
+        :param append: add the rows after the current ones instead of replacing them
+        """
         if not append:
             for i in self.mesh_list:
                 self.vl.removeWidget(i)
+                i.deleteLater()
+            self.mesh_list = []
 
-        self.mesh_list = []
         for m in mesh_list:
-            self.mesh_list.append(MeshInfoWidget(self, m[0], m[1], m[2]))
-        ixd = 1
-        for i in self.mesh_list:
-            self.vl.insertWidget(ixd, i)
-            ixd += 1
+            row = MeshInfoWidget(self, m[0], m[1], m[2])
+            self.vl.insertWidget(len(self.mesh_list) + 1, row)
+            self.mesh_list.append(row)
 
     def mesh_load_trigger(self):
         print("load mesh")
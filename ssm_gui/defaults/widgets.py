@@ -5,12 +5,15 @@ import vtk
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QIcon, QPixmap
 from PySide6.QtWidgets import (QWidget, QLabel, QLineEdit, QPushButton, QCheckBox, QHBoxLayout,
-                               QVBoxLayout, QProgressBar, QColorDialog, QSlider, QScrollArea, QMessageBox)
+                               QVBoxLayout, QProgressBar, QColorDialog, QSlider, QScrollArea, QMessageBox,
+                               QComboBox)
 from ptb.util.io.opendialog import OpenFiles
 from ptb.util.lang import CommonSymbols
 from ptb.util.io.helper import BasicIO
 from ptb.util.data import VTKMeshUtl
 from ssm_gui.__init__ import resource_path
+from ssm_gui.models.mesh import read_poly, poly_to_arrays
+from ssm_gui.models.inp import write_inp
 
 
 class InfoWidget(QWidget):
@@ -43,7 +46,7 @@ class InfoWidget(QWidget):
         self.checker.stateChanged.connect(checker_vis)
 
     def refresh(self):
-        self.root.world.vtk_widget.update()
+        self.root.world.request_render()
 
 
 class AngleInfoWidget(QWidget):
@@ -166,12 +169,7 @@ class MeshInfoWidget(QWidget):
         c = rng.uniform(0.5, 1.0, 3)
         color = [c[0], c[1], c[2]]
         # color = [1.0, 0.5, 0.5]
-        reader = vtk.vtkSTLReader()
-        if filename.endswith('.ply'):
-            reader = vtk.vtkPLYReader()
-        reader.SetFileName(filename)
-        reader.Update()
-        polydata = reader.GetOutput()
+        polydata = read_poly(filename)
         mapper = vtk.vtkPolyDataMapper()
         if vtk.VTK_MAJOR_VERSION <= 5:
             # mapper.SetInput(reader.GetOutput())
@@ -192,13 +190,15 @@ class MeshInfoWidget(QWidget):
         pass
 
     def refresh(self):
-        self.root.world.vtk_widget.update()
+        self.root.world.request_render()
 
     def set_checked(self, c):
         self.checker.setChecked(c)
 
     def delete_mesh(self):
         self.delete_actor()
+        self.actor = None
+        self.checker.setChecked(False)
         self.refresh()
 
     def delete_actor(self):
@@ -265,7 +265,6 @@ class OpacitySlider(QWidget):
         self.slider.setValue(i*100)
 
     def update_text_box(self):
-        print(self.slider.value())
         sdx = self.slider.value()/100
         self.text_box.setText("{0:0.2f}".format(sdx))
         self.listener(sdx)
@@ -286,18 +285,26 @@ class PCSlider(QWidget):
         self.slider.setRange(-200, 200)
         self.slider.setValue(0)
         self.slider.valueChanged.connect(self.update_text_box)
+        self.slider.sliderPressed.connect(self.root.drag_started)
+        self.slider.sliderReleased.connect(self.root.drag_finished)
         self.text_box = QLineEdit('0.0')
         self.text_box.setFixedWidth(40)
+        self.play_button = QPushButton()
+        self.play_button.setIcon(QIcon(resource_path('icons/play.png')))
+        self.play_button.setToolTip("Sweep {0} between -/+ the slider range".format(label))
+        self.play_button.setCheckable(True)
+        self.play_button.setFixedWidth(24)
+        self.play_button.toggled.connect(self.play_toggled)
         self.hor = QHBoxLayout()
         self.hor.addWidget(self.the_label)
         self.hor.addWidget(self.slider)
         self.hor.addWidget(self.text_box)
+        self.hor.addWidget(self.play_button)
         self.setFixedHeight(50)
         self.setFixedWidth(280)
         self.setLayout(self.hor)
 
     def update_text_box(self):
-        print(self.slider.value())
         sdx = self.slider.value()/100.0
         self.text_box.setText("{0:0.2f}".format(sdx))
         self.root.update_pcs(self.label, sdx)
@@ -305,6 +312,28 @@ class PCSlider(QWidget):
     def update_range(self, i):
         self.slider.setRange(-i*100, i*100)
 
+    def play_toggled(self, checked):
+        icon = 'icons/play_green.png' if checked else 'icons/play.png'
+        self.play_button.setIcon(QIcon(resource_path(icon)))
+        self.root.play_pc(self.label, checked)
+
+    def stop_play(self):
+        self.play_button.blockSignals(True)
+        self.play_button.setChecked(False)
+        self.play_button.setIcon(QIcon(resource_path('icons/play.png')))
+        self.play_button.blockSignals(False)
+
+    def set_value(self, sdx):
+        """
+        Move the slider without triggering a reconstruction, the value is clipped to the slider range
+        """
+        v = int(np.clip(np.round(sdx * 100), self.slider.minimum(), self.slider.maximum()))
+        self.slider.blockSignals(True)
+        self.slider.setValue(v)
+        self.slider.blockSignals(False)
+        self.text_box.setText("{0:0.2f}".format(v / 100.0))
+        return v / 100.0
+
     def reset(self):
         self.text_box.setText("{0:0.2f}".format(0))
         self.slider.setValue(0)
@@ -341,48 +370,35 @@ class SSMInfoWidget(QWidget):
 
         self.vlayout.addWidget(self.scroll)
         #self.vlayout.addStretch(5)
+        overlay = QWidget()
+        hv = QHBoxLayout()
+        hv.setContentsMargins(0, 0, 0, 0)
+        self.overlay_box = QComboBox()
+        self.overlay_box.setToolTip("Colour by the displacement of each vertex at +1 SD")
+        self.fill_overlay_box()
+        self.overlay_box.currentIndexChanged.connect(self.overlay_changed)
+        hv.addWidget(QLabel("Influence:"))
+        hv.addWidget(self.overlay_box, 1)
+        overlay.setLayout(hv)
+        self.vlayout.addWidget(overlay)
         self.export_button = QPushButton("Export")
         self.export_button.setFixedHeight(35)
         self.export_button.clicked.connect(self.export)
+        self.project_button = QPushButton("Project Mesh")
+        self.project_button.setFixedHeight(35)
+        self.project_button.setToolTip("Set the PCs from a corresponded mesh")
+        self.project_button.clicked.connect(self.project_mesh)
         self.reset_button = QPushButton("Reset")
         self.reset_button.setFixedHeight(35)
         self.reset_button.clicked.connect(self.reset)
         self.vlayout.addWidget(self.export_button)
+        self.vlayout.addWidget(self.project_button)
         self.vlayout.addWidget(self.reset_button)
         self.setLayout(self.vlayout)
         self.setFixedWidth(340)
         self.sd = [0 for i in range(0, self.number_pc)]
 
 
-    def as_inp(self, model_name, data):
-        ret = "*Heading\n"
-        ret += "** Job name: {0}\n".format(model_name)
-        ret += "** Generated by: {0}\n".format('gias3_ssm_viewer')
-        ret += "*Part, name = {0}\n".format(model_name)
-
-        ret += "*Node\n"
-        spaces = '  '
-        for i in range(0, len(str(data.GetNumberOfPoints()))):
-            spaces += ' '
-        for i in range(0, data.GetNumberOfPoints()):
-            point = data.GetPoint(i)
-            ret += "{4}{0}, {1}, {2}, {3}\n".format(i + 1, point[0], point[1], point[2], spaces)
-
-        ret += "*Element, type=S3\n"
-        spaces = ' '
-        for i in range(0, len(str(data.GetNumberOfCells()))):
-            spaces += ' '
-        for i in range(0, data.GetNumberOfCells()):
-            cell = data.GetCell(i)
-            cell_type = cell.GetCellType()
-            if cell_type == vtk.VTK_TRIANGLE:
-                ret += "{4}{0}, {1}, {2}, {3}\n".format(i + 1,
-                                                       cell.GetPointId(0) + 1,
-                                                       cell.GetPointId(1) + 1,
-                                                       cell.GetPointId(2) + 1,
-                                                       spaces)
-        return ret
-
     def export(self):
         op = OpenFiles()
         save = op.get_save_file(file_filter=("ply (*.ply);;stl (*.stl);;obj (*.obj);;FEBio/ Abaqus (*.inp);;All Files (*.*)"))
@@ -403,8 +419,7 @@ class SSMInfoWidget(QWidget):
             return
         def standard_surface_mesh():
             try:
-                k = self.model.qw.world.actors[self.model.model_name]
-                VTKMeshUtl.write(save, k.GetMapper().GetInput())
+                VTKMeshUtl.write(save, self.model.export_poly(self.sd))
                 pass
             except KeyError:
                 print("Unknown model")
@@ -413,11 +428,8 @@ class SSMInfoWidget(QWidget):
 
         def surface_inp_file():
             try:
-                k = self.model.qw.world.actors[self.model.model_name]
-                poly = k.GetMapper().GetInput()
-                ret_file = self.as_inp(self.model.model_name, poly)
-                with open(save, "w") as s:
-                    s.write(ret_file)
+                points, faces = poly_to_arrays(self.model.export_poly(self.sd))
+                write_inp(save, [(self.model.model_name, points, faces)], self.model.model_name)
                 return True
 
             except KeyError:
@@ -449,6 +461,49 @@ class SSMInfoWidget(QWidget):
 
         pass
 
+    def project_mesh(self):
+        op = OpenFiles()
+        mesh_file = op.get_file(file_filter=("Mesh (*.ply *.stl *.obj);;All Files (*.*)"))
+        if mesh_file is None:
+            return
+        try:
+            sd, residual = self.model.shape_model.project(mesh_file)
+        except AttributeError:
+            print("No model loaded")
+            return
+        except ValueError as e:
+            QMessageBox.critical(self, "Project Mesh", "Unable to project {0}:\n{1}".format(mesh_file, e))
+            return
+        print("Projected {0}, residual: {1}".format(mesh_file, residual[0]))
+        self.set_sd(sd[0])
+
+    def set_sd(self, sd):
+        """
+        Set all the PC sliders from a sd vector and reconstruct once
+        """
+        self.stop_play()
+        for i in range(0, min(len(sd), self.number_pc)):
+            self.sd[i] = self.pc_control['PC {0}'.format(i+1)].set_value(sd[i])
+        self.model.submit(self.sd)
+
+    def fill_overlay_box(self):
+        self.overlay_box.blockSignals(True)
+        self.overlay_box.clear()
+        self.overlay_box.addItem("Off")
+        self.overlay_box.addItem("All modes (SD)")
+        for i in range(0, self.number_pc):
+            self.overlay_box.addItem('PC {0}'.format(i+1))
+        self.overlay_box.setCurrentIndex(0)
+        self.overlay_box.blockSignals(False)
+
+    def overlay_changed(self, index):
+        # index 0 is off, 1 is the per vertex SD over all modes, then one entry per PC
+        pc = None if index <= 0 else index - 2
+        try:
+            self.model.show_influence(pc)
+        except AttributeError:
+            print("No model loaded")
+
     def reset_number_pc(self, n):
         print("Number of PCs")
         print(n)
@@ -466,6 +521,7 @@ class SSMInfoWidget(QWidget):
             self.pc_control[pc_label] = PCSlider(self, pc_label)
             self.vlayout_scroll.insertWidget(idx, self.pc_control[pc_label])
             idx += 1
+        self.fill_overlay_box()
         self.box.update()
         self.update()
 
@@ -475,10 +531,10 @@ class SSMInfoWidget(QWidget):
 
     def reset(self):
         print("Reset")
+        self.stop_play()
         try:
             self.sd = [0 for i in range(0, self.model.shape_model.weights.shape[0])]
-            m = self.model.shape_model.reconstruct_diff_all(self.sd, True)
-            self.model.update_actor(m)
+            self.model.submit(self.sd)
         except AttributeError:
             pass
         pass
@@ -486,17 +542,46 @@ class SSMInfoWidget(QWidget):
             self.pc_control[pc_label].reset()
 
 
-    def update_pcs(self, pc_label, sdx):
-        # print("update pc")
-        idx = int(pc_label.split(' ')[1])-1
-        self.sd[idx] = sdx
-        print(self.sd)
+    def play_pc(self, pc_label, play):
+        """
+        Start or stop the sweep animation of a PC, only one PC is swept at a time
+        """
+        for label in self.pc_control:
+            if label != pc_label:
+                self.pc_control[label].stop_play()
+        try:
+            if play:
+                sd_range = self.pc_control[pc_label].slider.maximum() / 100.0
+                self.model.play_sweep(int(pc_label.split(' ')[1]) - 1, sd_range)
+            else:
+                self.model.stop_sweep()
+        except AttributeError:
+            print("No model loaded")
+
+    def stop_play(self):
+        for label in self.pc_control:
+            self.pc_control[label].stop_play()
+
+    def drag_started(self):
+        self.stop_play()
+        # the viewer may swap in a low resolution proxy of the mesh while a slider is dragged
         try:
-            m = self.model.shape_model.reconstruct_diff_all(self.sd, True)
-            self.model.update_actor(m)
+            self.model.begin_drag()
         except AttributeError:
             pass
-        pass
+
+    def drag_finished(self):
+        try:
+            self.model.end_drag()
+        except AttributeError:
+            pass
+
+    def update_pcs(self, pc_label, sdx):
+        # Reconstructed on the worker thread, only the latest sd vector is computed and uploaded
+        idx = int(pc_label.split(' ')[1])-1
+        self.sd[idx] = sdx
+        self.stop_play()
+        self.model.submit(self.sd)
 
 
 class CameraWidget(QWidget):
@@ -555,6 +640,12 @@ class CameraWidget(QWidget):
         self.vlayout.addWidget(self.z_neg)
         self.vlayout.addSpacing(15)
         self.vlayout.addWidget(self.snap_button)
+
+        self.mesh_button = QPushButton('', self)
+        self.mesh_button.setIcon(QIcon(resource_path("icons/cubes.png")))
+        self.mesh_button.setToolTip("Show, colour or remove the dropped meshes.")
+        self.mesh_button.clicked.connect(lambda: self.root.show_mesh_menu(self.mesh_button))
+        self.vlayout.addWidget(self.mesh_button)
         self.vlayout.addStretch(10)
         self.setLayout(self.vlayout)
 
@@ -0,0 +1,354 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import vtk
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from ssm_gui.models.mesh import read_poly, poly_to_arrays, vtk_int32_array, VertexNormals
+
+
+class ShapeModelCache:
+    """
+    Sidecar "<pc>.cache/" directory of raw .npy arrays of a model, memory mapped when loaded
+    """
+    version = 1
+    manifest_name = "manifest.json"
+
+    def __init__(self, pc: str):
+        self.pc = pc
+        self.path = pc + ".cache"
+        self.manifest = None
+
+    def source_stamp(self):
+        st = os.stat(self.pc)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def read_manifest(self):
+        manifest_file = os.path.join(self.path, ShapeModelCache.manifest_name)
+        if not os.path.exists(manifest_file):
+            return None
+        try:
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != ShapeModelCache.version or manifest.get('source') != self.source_stamp():
+            return None
+        return manifest
+
+    def is_valid(self):
+        self.manifest = self.read_manifest()
+        return self.manifest is not None
+
+    def build(self):
+        """
+        Decompress the model file into the sidecar directory
+        """
+        s = np.load(self.pc, encoding='bytes', allow_pickle=True)
+        names = s.files if hasattr(s, 'files') else list(s.keys())
+        tmp = "{0}.tmp{1}".format(self.path, os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        arrays = {}
+        for n in names:
+            a = np.asarray(s[n])
+            if a.dtype == object:
+                # pickled entries (e.g. SD saved as None) can't be memory mapped
+                continue
+            if n == 'modes':
+                # column (per mode) contiguous, so leading modes can be read without the rest
+                a = np.asfortranarray(a)
+            np.save(os.path.join(tmp, n + ".npy"), a)
+            arrays[n] = {'shape': list(a.shape), 'dtype': a.dtype.str}
+        manifest = {'version': ShapeModelCache.version, 'source': self.source_stamp(), 'arrays': arrays}
+        with open(os.path.join(tmp, ShapeModelCache.manifest_name), "w") as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(tmp, self.path)
+        self.manifest = manifest
+
+    def load_arrays(self):
+        """
+        Memory map the model arrays, rebuilding the sidecar if it is missing or stale
+        :return: dict of name -> np.memmap
+        """
+        if not self.is_valid():
+            self.build()
+        return {n: self.load(n) for n in self.manifest['arrays']}
+
+    def load(self, name, mmap_mode='r'):
+        f = os.path.join(self.path, name + ".npy")
+        if not os.path.exists(f):
+            return None
+        return np.load(f, mmap_mode=mmap_mode)
+
+    def save(self, name, array):
+        """
+        Store a derived array in the sidecar
+        """
+        tmp = os.path.join(self.path, "{0}.tmp{1}.npy".format(name, os.getpid()))
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(self.path, name + ".npy"))
+
+
+class MeshCache:
+    """
+    Content addressed on-disk cache of parsed meshes, trimmed to max_bytes by least recent use
+    """
+    version = 1
+    shared = None
+    topology_names = ['incident', 'indptr', 'used', 'starts']
+
+    def __init__(self, root=None, max_bytes=2 ** 31):
+        if root is None:
+            base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+            root = os.path.join(base, 'ssm_gui', 'meshes')
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def default():
+        if MeshCache.shared is None:
+            MeshCache.shared = MeshCache()
+        return MeshCache.shared
+
+    @staticmethod
+    def content_hash(filename, block_size=2 ** 22):
+        h = hashlib.blake2b(digest_size=16)
+        with open(filename, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                h.update(block)
+        return h.hexdigest()
+
+    def index_file(self, filename):
+        key = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.root, 'index', key + '.json')
+
+    def lookup(self, filename):
+        """
+        :return: content hash of the file, from the index if its size and mtime are unchanged
+        """
+        st = os.stat(filename)
+        stamp = {'path': os.path.abspath(filename), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                 'version': MeshCache.version}
+        index = self.index_file(filename)
+        try:
+            with open(index) as f:
+                entry = json.load(f)
+            if {k: entry.get(k) for k in stamp} == stamp:
+                return entry['hash']
+        except (OSError, ValueError, KeyError):
+            pass
+        stamp['hash'] = MeshCache.content_hash(filename)
+        os.makedirs(os.path.dirname(index), exist_ok=True)
+        tmp = "{0}.tmp{1}.{2}".format(index, os.getpid(), threading.get_ident())
+        with open(tmp, 'w') as f:
+            json.dump(stamp, f)
+        os.replace(tmp, index)
+        return stamp['hash']
+
+    @staticmethod
+    def load_dir(path, names, mmap_mode='r'):
+        marker = os.path.join(path, 'done')
+        if not os.path.exists(marker):
+            return None
+        if not all(os.path.exists(os.path.join(path, n + '.npy')) for n in names):
+            return None     # written by an older version
+        arrays = {n: np.load(os.path.join(path, n + '.npy'), mmap_mode=mmap_mode) for n in names}
+        try:
+            os.utime(marker)     # last use, for evict()
+        except OSError:
+            pass
+        return arrays
+
+    @staticmethod
+    def save_dir(path, arrays):
+        """
+        Write the arrays to a temporary directory and rename it
+        """
+        # per thread, meshes sharing a topology may be cached by several loader threads at once
+        tmp = "{0}.tmp{1}.{2}".format(path, os.getpid(), threading.get_ident())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for n in arrays:
+            np.save(os.path.join(tmp, n + '.npy'), arrays[n])
+        open(os.path.join(tmp, 'done'), 'w').close()
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            if not os.path.exists(path):
+                raise
+            shutil.rmtree(tmp)     # written by another thread or process first
+
+    def load(self, filename):
+        """
+        Parsed mesh and derived arrays, memory mapped from the cache
+        :return: dict of points, connectivity, offsets, normals, point data and topology arrays
+        """
+        names = ['points', 'connectivity', 'offsets', 'normals', 'topology', 'point_data']
+        path = os.path.join(self.root, self.lookup(filename))
+        mesh = MeshCache.load_dir(path, names, mmap_mode='c')
+        if mesh is None:
+            if os.path.exists(os.path.join(path, 'done')):
+                MeshCache.remove_dir(path)     # complete, but from an older version
+            poly = read_poly(filename)
+            points, faces = poly_to_arrays(poly)
+            points = np.array(points)
+            normals = VertexNormals(faces, points.shape[0])
+            point_data = MeshCache.point_data(poly)
+            arrays = {'points': points,
+                      'connectivity': faces.ravel(),
+                      'offsets': np.arange(0, 3 * faces.shape[0] + 1, 3, dtype=np.int32),
+                      'normals': normals.compute(points, np.zeros(points.shape, dtype=np.float32)),
+                      'topology': np.array(MeshCache.content_hash_array(faces)),
+                      'point_data': np.array([p[:2] for p in point_data], dtype=str).reshape([-1, 2])}
+            for i, p in enumerate(point_data):
+                arrays['point_data_{0}'.format(i)] = p[2]
+            self.save_dir(path, arrays)
+            topology_path = self.save_topology(arrays['topology'], normals)
+            self.evict(keep=[path, topology_path])
+            mesh = MeshCache.load_dir(path, names, mmap_mode='c')
+        point_data = ['point_data_{0}'.format(i) for i in range(mesh['point_data'].shape[0])]
+        mesh.update(MeshCache.load_dir(path, point_data, mmap_mode='c'))
+        topology_path = os.path.join(self.root, 'topology', str(mesh['topology'][()]))
+        topology = MeshCache.load_dir(topology_path, MeshCache.topology_names)
+        if topology is None:
+            # evicted on its own, rebuilt from the cached connectivity
+            faces = np.asarray(mesh['connectivity']).reshape([-1, 3])
+            self.save_topology(mesh['topology'][()], VertexNormals(faces, mesh['points'].shape[0]))
+            topology = MeshCache.load_dir(topology_path, MeshCache.topology_names)
+        if topology is not None:
+            mesh.update(topology)
+        return mesh
+
+    @staticmethod
+    def point_data(poly):
+        """
+        :return: list of (name, attribute, array) of the point data arrays
+        """
+        point_data = poly.GetPointData()
+        active = {}
+        for attribute, a in (('scalars', point_data.GetScalars()), ('normals', point_data.GetNormals()),
+                             ('tcoords', point_data.GetTCoords())):
+            if a is not None and a.GetName() is not None:
+                active[a.GetName()] = attribute
+        arrays = []
+        for i in range(point_data.GetNumberOfArrays()):
+            a = point_data.GetArray(i)
+            if a is None or a.GetName() is None:
+                continue
+            arrays.append((a.GetName(), active.get(a.GetName(), ''), np.array(vtk_to_numpy(a))))
+        return arrays
+
+    @staticmethod
+    def content_hash_array(a):
+        return hashlib.blake2b(np.ascontiguousarray(a).tobytes(), digest_size=16).hexdigest()
+
+    def save_topology(self, key, normals):
+        path = os.path.join(self.root, 'topology', str(key))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            MeshCache.save_dir(path, {'incident': normals.incident, 'indptr': normals.indptr,
+                                      'used': normals.used, 'starts': normals.starts})
+        return path
+
+    def entries(self):
+        """
+        :return: list of (last use in ns, size in bytes, path) of the complete entries
+        """
+        entries = []
+        for parent in (self.root, os.path.join(self.root, 'topology')):
+            if not os.path.isdir(parent):
+                continue
+            for e in os.scandir(parent):
+                if not e.is_dir() or e.name in ('index', 'topology') or '.tmp' in e.name:
+                    continue
+                try:
+                    used = os.stat(os.path.join(e.path, 'done')).st_mtime_ns
+                    size = sum(f.stat().st_size for f in os.scandir(e.path))
+                except OSError:
+                    continue    # being written or removed
+                entries.append((used, size, e.path))
+        return entries
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used entries, except keep, until the cache is at most max_bytes
+        """
+        if self.max_bytes is None:
+            return
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        for used, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            if MeshCache.remove_dir(path):
+                total -= size
+
+    @staticmethod
+    def remove_dir(path):
+        """
+        Rename an entry before removing it
+        :return: False if it could not be removed
+        """
+        tmp = "{0}.tmp{1}.{2}".format(path, os.getpid(), threading.get_ident())
+        try:
+            os.replace(path, tmp)
+        except OSError:
+            return False
+        shutil.rmtree(tmp, ignore_errors=True)
+        return True
+
+    def poly(self, filename):
+        """
+        vtkPolyData wrapping the cached arrays without copying
+        """
+        return MeshCache.wrap(self.load(filename))
+
+    @staticmethod
+    def wrap(mesh):
+        """
+        :param mesh: dict returned by load()
+        """
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_to_vtk(mesh['points'], deep=False))
+        cells = vtk.vtkCellArray()
+        cells.SetData(vtk_int32_array(mesh['offsets']), vtk_int32_array(mesh['connectivity']))
+        poly = vtk.vtkPolyData()
+        poly.SetPoints(vtk_points)
+        poly.SetPolys(cells)
+        point_data = poly.GetPointData()
+        for i, (name, attribute) in enumerate(mesh.get('point_data', [])):
+            a = numpy_to_vtk(mesh['point_data_{0}'.format(i)], deep=False)
+            a.SetName(str(name))
+            point_data.AddArray(a)
+            if attribute == 'scalars':
+                point_data.SetActiveScalars(str(name))
+            elif attribute == 'normals':
+                point_data.SetActiveNormals(str(name))
+            elif attribute == 'tcoords':
+                point_data.SetActiveTCoords(str(name))
+        return poly
+
+
+def cached_poly(filename):
+    """
+    Read a mesh through the shared MeshCache, or directly if the cache can't be written
+    """
+    try:
+        return MeshCache.default().poly(filename)
+    except OSError as e:
+        print("Unable to use the mesh cache for {0}: {1}".format(filename, e))
+        return read_poly(filename)
@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class InpWriter:
+    """
+    Streamed Abaqus/FEBio .inp writer, formatting a block of rows at a time
+    """
+    element_types = {3: 'S3', 4: 'S4', 8: 'S8R'}
+
+    def __init__(self, filename, job_name="", generated_by="gias3_ssm_viewer", chunk_size=2 ** 16,
+                 float_format="%.12g"):
+        self.chunk_size = chunk_size
+        self.float_format = float_format
+        self.parts = []
+        self.file = open(filename, "w")
+        self.file.write("*Heading\n** Job name: {0}\n** Generated by: {1}\n".format(job_name, generated_by))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.file is not None:
+            self.file.close()     # incomplete, no assembly
+            self.file = None
+        self.close()
+
+    def write_rows(self, row_format, rows):
+        """
+        :param rows: (M x C) array, one value per field of row_format
+        """
+        for i in range(0, rows.shape[0], self.chunk_size):
+            block = rows[i: i + self.chunk_size]
+            self.file.write((row_format * block.shape[0]) % tuple(block.ravel().tolist()))
+
+    def write_ids(self, ids, per_line=16):
+        """
+        Set members, per_line to a line as Abaqus expects
+        """
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        full = ids.shape[0] - ids.shape[0] % per_line
+        self.write_rows(", ".join(["%d"] * per_line) + "\n", ids[:full].reshape([-1, per_line]))
+        if full < ids.shape[0]:
+            self.file.write(", ".join(str(i) for i in ids[full:].tolist()) + "\n")
+
+    def add_part(self, name, points, faces, element_type=None, node_sets=None, element_sets=None):
+        """
+        :param faces: (F x k) zero based node indices of each element
+        :param node_sets: optional dict of name to zero based node indices (or boolean mask)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape([-1, 3])
+        faces = np.asarray(faces)
+        if element_type is None:
+            element_type = InpWriter.element_types[faces.shape[1]]
+        self.file.write("*Part, name={0}\n*Node\n".format(name))
+        width = len(str(points.shape[0]))
+        rows = np.empty([points.shape[0], 4])
+        rows[:, 0] = np.arange(1, points.shape[0] + 1)
+        rows[:, 1:] = points
+        self.write_rows("  %{0}d, {1}, {1}, {1}\n".format(width, self.float_format), rows)
+
+        self.file.write("*Element, type={0}\n".format(element_type))
+        width = len(str(faces.shape[0]))
+        rows = np.empty([faces.shape[0], faces.shape[1] + 1], dtype=np.int64)
+        rows[:, 0] = np.arange(1, faces.shape[0] + 1)
+        rows[:, 1:] = faces
+        rows[:, 1:] += 1
+        self.write_rows("  %{0}d, ".format(width) + ", ".join(["%d"] * faces.shape[1]) + "\n", rows)
+
+        for keyword, sets in (("*Nset, nset", node_sets), ("*Elset, elset", element_sets)):
+            if sets is None:
+                continue
+            for set_name in sets:
+                ids = np.asarray(sets[set_name])
+                if ids.dtype == bool:
+                    ids = np.flatnonzero(ids)
+                self.file.write("{0}={1}\n".format(keyword, set_name))
+                self.write_ids(ids + 1)
+        self.file.write("*End Part\n")
+        self.parts.append(name)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.write("*Assembly, name=Assembly\n")
+        for name in self.parts:
+            self.file.write("*Instance, name={0}-1, part={0}\n*End Instance\n".format(name))
+        self.file.write("*End Assembly\n")
+        self.file.close()
+        self.file = None
+
+
+def write_inp(filename, parts, job_name=""):
+    """
+    :param parts: list of (name, points, faces) or (name, points, faces, node_sets, element_sets)
+    """
+    with InpWriter(filename, job_name) as inp:
+        for part in parts:
+            inp.add_part(*part[:3], node_sets=part[3] if len(part) > 3 else None,
+                         element_sets=part[4] if len(part) > 4 else None)
+    return filename
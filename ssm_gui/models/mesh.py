@@ -0,0 +1,561 @@
+import os
+
+import numpy as np
+import vtk
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+
+def vtk_int32_array(a):
+    """
+    Wrap a numpy int32 array as a vtkTypeInt32Array without copying
+    """
+    a = np.ascontiguousarray(a, dtype=np.int32).ravel()
+    ret = vtk.vtkTypeInt32Array()
+    ret.SetVoidArray(a, a.shape[0], 1)
+    ret._numpy_reference = a    # keeps the numpy buffer alive as long as the vtk array
+    return ret
+
+
+def set_vtk_buffer(vtk_array, a):
+    """
+    Point a vtk array at another numpy buffer of the same size without copying
+    """
+    vtk_array.SetVoidArray(a, a.size, 1)
+    vtk_array._numpy_reference = a
+
+
+def arrays_to_poly(points, faces):
+    """
+    Triangle vtkPolyData sharing the numpy points (N x 3) and faces (F x 3)
+    """
+    points = np.ascontiguousarray(points)
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(points, deep=False))
+    offsets = np.arange(0, 3 * faces.shape[0] + 1, 3, dtype=np.int32)
+    cells = vtk.vtkCellArray()
+    cells.SetData(vtk_int32_array(offsets), vtk_int32_array(faces))
+    poly = vtk.vtkPolyData()
+    poly.SetPoints(vtk_points)
+    poly.SetPolys(cells)
+    return poly
+
+
+def poly_to_arrays(poly):
+    """
+    :param poly: vtk.vtkPolyData
+    :return: points (N x 3) and triangle faces (F x 3, int32), non triangle polygons are triangulated
+    """
+    points = vtk_to_numpy(poly.GetPoints().GetData())
+    polys = poly.GetPolys()
+    offsets = vtk_to_numpy(polys.GetOffsetsArray())
+    if offsets.shape[0] > 1 and not np.all(np.diff(offsets) == 3):
+        triangles = vtk.vtkTriangleFilter()
+        triangles.SetInputData(poly)
+        triangles.PassLinesOff()
+        triangles.PassVertsOff()
+        triangles.Update()
+        polys = triangles.GetOutput().GetPolys()
+    faces = vtk_to_numpy(polys.GetConnectivityArray()).reshape([-1, 3]).astype(np.int32)
+    return points, faces
+
+
+ply_types = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': '<i2', 'int16': '<i2',
+             'ushort': '<u2', 'uint16': '<u2', 'int': '<i4', 'int32': '<i4', 'uint': '<u4', 'uint32': '<u4',
+             'float': '<f4', 'float32': '<f4', 'double': '<f8', 'float64': '<f8'}
+# vertex properties vtkPLYReader turns into point data (normals, colours, texture coordinates)
+ply_point_data = {'nx', 'ny', 'nz', 'red', 'green', 'blue', 'alpha', 'u', 'v', 's', 't',
+                  'texture_u', 'texture_v', 'texture_s', 'texture_t'}
+
+
+def read_ply_header(f):
+    """
+    :return: list of (element name, count, properties) and the header size in bytes,
+             None if the file is not a binary little endian PLY
+    """
+    if f.readline().strip() != b'ply':
+        return None
+    elements = []
+    binary = False
+    while True:
+        line = f.readline()
+        if not line:
+            return None
+        words = line.split()
+        if not words or words[0] in (b'comment', b'obj_info'):
+            continue
+        if words[0] == b'format':
+            binary = words[1] == b'binary_little_endian'
+        elif words[0] == b'element':
+            elements.append((words[1].decode(), int(words[2]), []))
+        elif words[0] == b'property' and elements:
+            if words[1] == b'list':
+                elements[-1][2].append((words[4].decode(), ('list', words[2].decode(), words[3].decode())))
+            else:
+                elements[-1][2].append((words[2].decode(), words[1].decode()))
+        elif words[0] == b'end_header':
+            break
+    if not binary:
+        return None
+    return elements, f.tell()
+
+
+def read_ply_arrays(filename):
+    """
+    Read a binary little endian triangle PLY with numpy
+    :return: points (N x 3) and faces (F x 3, int32), None if the file needs the VTK reader
+    """
+    with open(filename, 'rb') as f:
+        header = read_ply_header(f)
+    if header is None:
+        return None
+    elements, offset = header
+    points = None
+    faces = None
+    for name, count, properties in elements:
+        if name == 'face' and len(properties) == 1 and properties[0][1][0] == 'list':
+            list_type = properties[0][1]
+            if list_type[1] not in ply_types or list_type[2] not in ply_types:
+                return None
+            dtype = np.dtype([('n', ply_types[list_type[1]]), ('v', ply_types[list_type[2]], (3,))])
+            block = np.fromfile(filename, dtype=dtype, count=count, offset=offset)
+            if block.shape[0] != count or not np.all(block['n'] == 3):
+                return None
+            faces = np.ascontiguousarray(block['v'], dtype=np.int32)
+        else:
+            if any(p[1][0] == 'list' or p[1] not in ply_types for p in properties):
+                return None
+            dtype = np.dtype([(p[0], ply_types[p[1]]) for p in properties])
+            if name == 'vertex':
+                if dtype.names[:3] != ('x', 'y', 'z') or ply_point_data.intersection(dtype.names):
+                    return None
+                block = np.memmap(filename, dtype=dtype, mode='c', offset=offset, shape=(count,))
+                xyz = dtype.fields['x'][0]
+                if dtype.itemsize == 3 * xyz.itemsize and dtype['y'] == xyz and dtype['z'] == xyz:
+                    # x, y, z only: the block is already an (N x 3) array
+                    points = block.view(xyz).reshape([count, 3])
+                else:
+                    points = np.stack([block['x'], block['y'], block['z']], axis=1)
+        offset += dtype.itemsize * count
+    if points is None or faces is None:
+        return None
+    return points, faces
+
+
+def read_stl_arrays(filename):
+    """
+    Read a binary STL with numpy, merging corners like vtkSTLReader
+    :return: points (N x 3, float32) and faces (F x 3, int32), None for ASCII STL
+    """
+    record = np.dtype([('normal', '<f4', (3,)), ('v', '<f4', (3, 3)), ('attribute', '<u2')])
+    size = os.path.getsize(filename)
+    if size < 84:
+        return None
+    with open(filename, 'rb') as f:
+        f.seek(80)
+        count = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+    if size != 84 + count * record.itemsize:
+        return None
+    block = np.fromfile(filename, dtype=record, count=count, offset=84)
+    corners = np.ascontiguousarray(block['v']).reshape([-1, 3])
+    corners += 0.0      # -0.0 becomes 0.0, so the two merge like they do in vtkSTLReader
+    # merge exactly equal corners: stable sort on the bit patterns, the first corner of each run of
+    # equal keys is the first appearance, vertices are numbered in order of first appearance
+    bits = corners.view(np.uint32)
+    xy = (bits[:, 0].astype(np.uint64) << np.uint64(32)) | bits[:, 1]
+    order = np.lexsort((bits[:, 2], xy))
+    xy = xy[order]
+    z = bits[order, 2]
+    new = np.empty(order.shape[0], dtype=bool)
+    new[:1] = True
+    new[1:] = (xy[1:] != xy[:-1]) | (z[1:] != z[:-1])
+    group = np.cumsum(new) - 1
+    first = order[new]
+    sequence = np.argsort(first)
+    rank = np.empty_like(sequence)
+    rank[sequence] = np.arange(sequence.shape[0])
+    index = np.empty(order.shape[0], dtype=np.int32)
+    index[order] = rank[group]
+    faces = index.reshape([-1, 3])
+    # facets that collapse after the merge are dropped, their vertices are kept
+    degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+    return corners[first[sequence]], faces[~degenerate]
+
+
+def read_poly(filename):
+    """
+    Read a mesh keeping the vertex order of the file
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    arrays = None
+    if ext == '.ply':
+        arrays = read_ply_arrays(filename)
+    elif ext == '.stl':
+        arrays = read_stl_arrays(filename)
+    if arrays is not None:
+        return arrays_to_poly(*arrays)
+    readers = {'.ply': vtk.vtkPLYReader, '.stl': vtk.vtkSTLReader, '.obj': vtk.vtkOBJReader,
+               '.vtp': vtk.vtkXMLPolyDataReader, '.vtk': vtk.vtkPolyDataReader}
+    if ext not in readers:
+        raise ValueError("Unsupported mesh format: {0}".format(filename))
+    reader = readers[ext]()
+    reader.SetFileName(filename)
+    reader.Update()
+    return reader.GetOutput()
+
+
+def read_mesh(filename):
+    """
+    :return: points (N x 3) and triangle faces (F x 3, int32)
+    """
+    return poly_to_arrays(read_poly(filename))
+
+
+def write_ply(filename, points, faces):
+    """
+    Write a binary little endian ply
+    """
+    points = np.ascontiguousarray(points, dtype='<f4')
+    face_block = np.empty(faces.shape[0], dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+    face_block['n'] = 3
+    face_block['v'] = faces
+    header = "ply\nformat binary_little_endian 1.0\n"
+    header += "element vertex {0}\nproperty float x\nproperty float y\nproperty float z\n".format(points.shape[0])
+    header += "element face {0}\nproperty list uchar int vertex_indices\nend_header\n".format(faces.shape[0])
+    with open(filename, "wb") as f:
+        f.write(header.encode('ascii'))
+        f.write(points.tobytes())
+        f.write(face_block.tobytes())
+
+
+def sub_mesh_faces(faces, mask):
+    """
+    Faces with all three vertices in the mask, renumbered to the masked vertices
+    """
+    keep = np.all(mask[faces], axis=1)
+    remap = np.full(mask.shape[0], -1, dtype=np.int32)
+    remap[mask] = np.arange(np.count_nonzero(mask), dtype=np.int32)
+    return remap[faces[keep]]
+
+
+def point_normals(poly):
+    """
+    Per vertex normals, keeping the vertex count (no splitting)
+    """
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputData(poly)
+    normals.ComputePointNormalsOn()
+    normals.ComputeCellNormalsOff()
+    normals.SplittingOff()
+    normals.Update()
+    return np.array(vtk_to_numpy(normals.GetOutput().GetPointData().GetNormals()), dtype=np.float32)
+
+
+def decimate(poly, reduction=0.9):
+    """
+    Decimated proxy of a mesh, its vertices are a subset of the mesh's
+    :return: proxy vtkPolyData and (M) indices of its vertices in poly
+    """
+    source = vtk.vtkPolyData()
+    source.SetPoints(poly.GetPoints())
+    source.SetPolys(poly.GetPolys())
+    ids = numpy_to_vtk(np.arange(poly.GetNumberOfPoints(), dtype=np.int64), deep=True)
+    ids.SetName("ids")
+    source.GetPointData().AddArray(ids)
+    d = vtk.vtkDecimatePro()
+    d.SetInputData(source)
+    d.SetTargetReduction(reduction)
+    d.PreserveTopologyOn()
+    d.Update()
+    out = d.GetOutput()
+    vertex_ids = np.array(vtk_to_numpy(out.GetPointData().GetArray("ids")), dtype=np.int64)
+    proxy = vtk.vtkPolyData()
+    proxy.SetPoints(out.GetPoints())
+    proxy.SetPolys(out.GetPolys())
+    return proxy, vertex_ids
+
+
+def decimate_quadric(points, faces, reduction=0.9):
+    """
+    Quadric decimation, vertices are moved so the result is not a subset of them
+    :return: points (M x 3) and triangle faces (F' x 3, int32)
+    """
+    d = vtk.vtkQuadricDecimation()
+    d.SetInputData(arrays_to_poly(np.asarray(points, dtype=np.float64), faces))
+    d.SetTargetReduction(reduction)
+    d.VolumePreservationOn()
+    d.Update()
+    return poly_to_arrays(d.GetOutput())
+
+
+def face_incidence(faces, n_points):
+    """
+    Faces around each vertex as CSR arrays
+    :return: incident (3F) faces grouped by vertex, indptr (N + 1)
+    """
+    corners = np.asarray(faces).ravel()
+    order = np.argsort(corners, kind='stable')
+    counts = np.bincount(corners, minlength=n_points)
+    indptr = np.zeros(n_points + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return order // 3, indptr
+
+
+def nearest_vertices(points, targets):
+    """
+    Index of the closest vertex to each target point
+    """
+    source = vtk.vtkPolyData()
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(np.ascontiguousarray(points, dtype=np.float64), deep=True))
+    source.SetPoints(vtk_points)
+    # interpolated values come back as float32, exact below 2^24, so the ids are split in two
+    ids = np.arange(points.shape[0], dtype=np.int64)
+    for name, values in (('ids_high', ids >> 12), ('ids_low', ids & 4095)):
+        a = numpy_to_vtk(values, deep=True)
+        a.SetName(name)
+        source.GetPointData().AddArray(a)
+    target_poly = vtk.vtkPolyData()
+    target_points = vtk.vtkPoints()
+    target_points.SetData(numpy_to_vtk(np.ascontiguousarray(targets, dtype=np.float64), deep=True))
+    target_poly.SetPoints(target_points)
+    locator = vtk.vtkStaticPointLocator()
+    locator.SetDataSet(source)
+    locator.BuildLocator()
+    interpolator = vtk.vtkPointInterpolator()
+    interpolator.SetInputData(target_poly)
+    interpolator.SetSourceData(source)
+    interpolator.SetKernel(vtk.vtkVoronoiKernel())     # value of the closest point
+    interpolator.SetLocator(locator)
+    interpolator.SetNullPointsStrategyToClosestPoint()
+    interpolator.Update()
+    data = interpolator.GetOutput().GetPointData()
+    high = np.rint(vtk_to_numpy(data.GetArray('ids_high'))).astype(np.int64)
+    low = np.rint(vtk_to_numpy(data.GetArray('ids_low'))).astype(np.int64)
+    return (high << 12) | low
+
+
+def closest_on_triangles(p, a, b, c):
+    """
+    Closest point on each triangle (a, b, c) to p (Ericson, Real-Time Collision Detection 5.1.5)
+    :return: (M x 3) barycentric weights and (M) squared distances
+    """
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    d1 = np.einsum('ij,ij->i', ab, ap)
+    d2 = np.einsum('ij,ij->i', ac, ap)
+    ab_ab = np.einsum('ij,ij->i', ab, ab)
+    ab_ac = np.einsum('ij,ij->i', ab, ac)
+    ac_ac = np.einsum('ij,ij->i', ac, ac)
+    d3 = d1 - ab_ab     # ab . (p - b)
+    d4 = d2 - ab_ac     # ac . (p - b)
+    d5 = d1 - ab_ac     # ab . (p - c)
+    d6 = d2 - ac_ac     # ac . (p - c)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    weights = np.empty([p.shape[0], 3])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = va + vb + vc
+        weights[:, 1] = vb / total
+        weights[:, 2] = vc / total
+        weights[:, 0] = 1.0 - weights[:, 1] - weights[:, 2]
+        # regions from the lowest to the highest priority, a later one overrides
+        bc = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        weights[bc] = np.stack([np.zeros_like(w[bc]), 1.0 - w[bc], w[bc]], axis=1)
+        on_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        w = d2 / (d2 - d6)
+        weights[on_ac] = np.stack([1.0 - w[on_ac], np.zeros_like(w[on_ac]), w[on_ac]], axis=1)
+        weights[(d6 >= 0) & (d5 <= d6)] = [0.0, 0.0, 1.0]
+        on_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        v = d1 / (d1 - d3)
+        weights[on_ab] = np.stack([1.0 - v[on_ab], v[on_ab], np.zeros_like(v[on_ab])], axis=1)
+        weights[(d3 >= 0) & (d4 <= d3)] = [0.0, 1.0, 0.0]
+        weights[(d1 <= 0) & (d2 <= 0)] = [1.0, 0.0, 0.0]
+    weights[~np.all(np.isfinite(weights), axis=1)] = [1.0, 0.0, 0.0]    # degenerate triangle
+    offset = ap - weights[:, 1, None] * ab - weights[:, 2, None] * ac
+    return weights, np.einsum('ij,ij->i', offset, offset)
+
+
+def closest_around(points, faces, incident, indptr, targets, owner, vertices):
+    """
+    Closest face, barycentric weights and squared distance around one vertex per target
+    """
+    counts = indptr[vertices + 1] - indptr[vertices]
+    starts = np.cumsum(counts) - counts
+    pair_owner = np.repeat(owner, counts)
+    offsets = np.repeat(indptr[vertices] - starts, counts)
+    candidates = incident[np.arange(pair_owner.shape[0]) + offsets]
+    tri = faces[candidates]
+    weights, dist2 = closest_on_triangles(targets[pair_owner], points[tri[:, 0]], points[tri[:, 1]],
+                                          points[tri[:, 2]])
+    best = np.minimum.reduceat(dist2, starts)
+    # first candidate of each fan reaching its minimum
+    hits = np.flatnonzero(dist2 == np.repeat(best, counts))
+    group = np.repeat(np.arange(owner.shape[0]), counts)[hits]
+    first = hits[np.r_[True, group[1:] != group[:-1]]]
+    return candidates[first], weights[first], dist2[first]
+
+
+def barycentric_transfer(points, faces, targets, near=0.5, max_steps=16):
+    """
+    Closest point on the surface (points, faces) to each target
+    :return: (M x 3) triangle vertex indices and (M x 3) barycentric weights
+    """
+    points = np.asarray(points, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.float64)
+    m = targets.shape[0]
+    if m == 0:
+        return np.zeros([0, 3], dtype=np.int64), np.zeros([0, 3])
+    incident, indptr = face_incidence(faces, points.shape[0])
+    used = np.flatnonzero(np.diff(indptr) > 0)     # vertices with at least one face
+    nearest = used[nearest_vertices(points[used], targets)]
+    cells = np.full(m, -1, dtype=np.int64)
+    weights = np.zeros([m, 3])
+    dist2 = np.full(m, np.inf)
+    # the closest point inside a triangle, or on an edge or vertex whose triangles were all tested,
+    # is final, otherwise the search moves on to the fan of the vertex with the largest weight
+    moving = np.arange(m)
+    vertices = nearest
+    for step in range(max_steps):
+        cell, w, d2 = closest_around(points, faces, incident, indptr, targets, moving, vertices)
+        better = d2 < dist2[moving]
+        t = moving[better]
+        cells[t] = cell[better]
+        weights[t] = w[better]
+        dist2[t] = d2[better]
+        heaviest = faces[cells[moving], np.argmax(weights[moving], axis=1)]
+        edge = np.any(weights[moving] <= 0, axis=1) & (heaviest != vertices)
+        moving = moving[edge]
+        vertices = heaviest[edge]
+        if moving.shape[0] == 0:
+            break
+
+    tri = points[faces[cells]]
+    shortest = np.min(np.linalg.norm(tri - np.roll(tri, 1, axis=1), axis=2), axis=1)
+    far = ~(np.sqrt(dist2) <= near * shortest)
+    far[moving] = True
+    missed = np.flatnonzero(far)
+    if missed.shape[0] > 0:
+        locator = vtk.vtkStaticCellLocator()
+        locator.SetDataSet(arrays_to_poly(points, faces))
+        locator.BuildLocator()
+        c = [0.0, 0.0, 0.0]
+        cell_id = vtk.reference(0)
+        sub_id = vtk.reference(0)
+        dist = vtk.reference(0.0)
+        for i in missed:
+            locator.FindClosestPoint(targets[i], c, cell_id, sub_id, dist)
+            cells[i] = cell_id.get()
+        tri = faces[cells[missed]]
+        weights[missed] = closest_on_triangles(targets[missed], points[tri[:, 0]], points[tri[:, 1]],
+                                               points[tri[:, 2]])[0]
+    return faces[cells], weights
+
+
+def surface_distance(points, faces, targets):
+    """
+    Unsigned distance from each target point to the surface
+    """
+    target_poly = vtk.vtkPolyData()
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(np.ascontiguousarray(targets, dtype=np.float64), deep=True))
+    target_poly.SetPoints(vtk_points)
+    distance = vtk.vtkImplicitPolyDataDistance()
+    distance.SetInput(arrays_to_poly(np.asarray(points, dtype=np.float64), faces))
+    out = vtk.vtkDoubleArray()
+    distance.FunctionValue(target_poly.GetPoints().GetData(), out)
+    return np.abs(vtk_to_numpy(out))
+
+
+class DisplacementScalars:
+    """
+    Per vertex displacement from a reference shape, 'magnitude' or signed along the 'normal'
+    """
+    modes = ['magnitude', 'normal']
+
+    def __init__(self, reference, normals=None, mode='magnitude'):
+        self.reference = np.asarray(reference)
+        self.normals = normals
+        self.mode = mode
+        self.scratch = np.empty(self.reference.shape, dtype=self.reference.dtype)
+
+    def copy(self):
+        return DisplacementScalars(self.reference, self.normals, self.mode)
+
+    def compute(self, points, out):
+        """
+        :param points: (N x 3) vertices
+        :param out: (N) float32 scalar buffer
+        """
+        np.subtract(points, self.reference, out=self.scratch, casting='same_kind')
+        if self.mode == 'normal' and self.normals is not None:
+            np.einsum('ij,ij->i', self.scratch, self.normals, out=out, casting='same_kind')
+        else:
+            np.einsum('ij,ij->i', self.scratch, self.scratch, out=out, casting='same_kind')
+            np.sqrt(out, out=out)
+        return out
+
+
+class VertexNormals:
+    """
+    Area weighted unit vertex normals of a triangle mesh with a fixed topology
+    """
+
+    def __init__(self, faces, n_points, topology=None):
+        self.faces = np.asarray(faces, dtype=np.int64)
+        self.n_points = n_points
+        if topology is None:
+            incident, indptr = face_incidence(self.faces, n_points)
+            used = np.diff(indptr) > 0
+            topology = (incident, indptr, used, indptr[:-1][used])
+        self.incident, self.indptr, self.used, self.starts = topology
+        self.corners = np.ascontiguousarray(self.faces.T)
+        f = self.faces.shape[0]
+        # component major (3 x F) buffers, every step is a contiguous 1D operation
+        self.points = np.empty([3, n_points])
+        self.edge0 = np.empty([3, f])
+        self.edge1 = np.empty([3, f])
+        self.face_normals = np.empty([3, f])
+        self.tmp = np.empty(f)
+        self.corner_points = np.empty([3, f])
+        self.all_used = bool(np.all(self.used))
+        self.corner_normals = np.empty(self.incident.shape[0])
+        self.sums = np.empty([3, self.starts.shape[0]])
+
+    def copy(self):
+        return VertexNormals(self.faces, self.n_points, (self.incident, self.indptr, self.used, self.starts))
+
+    def compute(self, points, out):
+        """
+        :param points: (N x 3) vertices
+        :param out: (N x 3) float32 normal buffer
+        """
+        np.copyto(self.points, np.transpose(points), casting='same_kind')
+        for i in range(3):
+            x = self.points[i]
+            c = self.corner_points
+            for j in range(3):
+                np.take(x, self.corners[j], out=c[j])
+            np.subtract(c[1], c[0], out=self.edge0[i])
+            np.subtract(c[2], c[0], out=self.edge1[i])
+        # the length of the cross product is twice the triangle area, so the sum is area weighted
+        e0, e1, n = self.edge0, self.edge1, self.face_normals
+        for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+            np.multiply(e0[j], e1[k], out=n[i])
+            np.multiply(e0[k], e1[j], out=self.tmp)
+            n[i] -= self.tmp
+        for i in range(3):
+            np.take(n[i], self.incident, out=self.corner_normals)
+            np.add.reduceat(self.corner_normals, self.starts, out=self.sums[i])
+        length = np.sqrt(np.einsum('ij,ij->j', self.sums, self.sums))
+        length[length == 0] = 1.0
+        self.sums /= length
+        if self.all_used:
+            np.copyto(out, self.sums.T, casting='same_kind')
+        else:
+            out[self.used] = self.sums.T
+            out[~self.used] = 0
+        return out
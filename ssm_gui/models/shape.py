@@ -2,54 +2,360 @@ import numpy as np
 from ptb.util.lang import milli
 import os
 import pandas as pd
+import json
+
+from ssm_gui.models.cache import ShapeModelCache
+from ssm_gui.models.mesh import (read_mesh, write_ply, sub_mesh_faces, decimate_quadric, barycentric_transfer,
+                                 surface_distance)
+from ssm_gui.models import ssmb
 
 
 class ShapeModel:
-    def __init__(self, pc: str = None):
+    precisions = ['float64', 'float32']
+
+    def __init__(self, pc: str = None, use_cache=True, precision='float64', n_modes=None, variance=None):
+        """
+        :param pc: path to the .pc.npz/.pc or .ssmb file
+        :param precision: 'float64' or 'float32' for interactive reconstruction
+        """
         st = milli()
-        if pc is not None and pc.endswith(".pc.npz") or pc.endswith(".pc"):
-            s = np.load(pc, encoding='bytes', allow_pickle=True)
+        self.pc_file = pc
+        self.cache = None
+        self.precision = 'float64'
+        self.precision_deviation = None
+        self.influence = None   # per mode influence maps and per vertex SD, see influence_maps()
+        self.sd_field = None
+        if pc is not None and (pc.endswith(".pc.npz") or pc.endswith(".pc")):
+            s = self.load_arrays(pc, use_cache)
+        elif pc is not None and pc.endswith(".ssmb"):
+            s = ssmb.read_ssmb(pc)
         else:
             return
-        self.mean = s['mean']
-        self.weights = s['weights']  # PC weights are variance
-        self.modes = s['modes']
-        self.SD = None      # Not always present
-        try:
-            self.SD = s['SD']
-        except ValueError:
-            pass
-
-        self.projectedWeights = None # Not always present
-        try:
-            self.projectedWeights = s['projectedWeights']
-        except ValueError:
-            pass
+        self.setup(s, precision, n_modes, variance)
 
         en = milli()
         print("time to for mapping pcs: {0} msec".format(en - st))
         print()
 
-    def reconstruct_diff_all(self, sd, add_mean=False):
-        w = np.atleast_2d(sd * np.sqrt(self.weights))
-        self.projectedWeights
-        m = np.dot(w, self.modes.T)
-        me = m.T
+    @classmethod
+    def from_arrays(cls, mean, weights, modes=None, scaled_modes=None, precision='float64'):
+        """
+        Build a model in memory from the (3N) mean, (K) variances and (3N x K) orthonormal modes
+        """
+        model = cls()
+        s = {'mean': np.asarray(mean, dtype=np.float64), 'weights': np.asarray(weights, dtype=np.float64)}
+        if modes is not None:
+            s['modes'] = modes
+        if scaled_modes is not None:
+            s['scaled_modes'] = scaled_modes
+        model.setup(s, precision)
+        return model
+
+    def setup(self, s, precision='float64', n_modes=None, variance=None):
+        self.influence = None
+        self.sd_field = None
+        self.mean = s['mean']
+        self.total_modes = s['weights'].shape[0]
+        k = ShapeModel.number_of_modes(s['weights'], n_modes, variance)
+        self.explained_variance = float(np.sum(s['weights'][:k]) / np.sum(s['weights']))
+        self.weights = np.array(s['weights'][:k])  # PC weights are variance
+        self.modes = None   # .ssmb only stores the scaled modes
+        if 'modes' in s:
+            # column contiguous when memory mapped, so only the leading k modes are read from disk
+            self.modes = np.asfortranarray(s['modes'][:, :k])
+        self.SD = s.get('SD')    # Not always present
+        if self.SD is not None and self.SD.ndim > 0 and self.SD.shape[0] == self.total_modes:
+            self.SD = self.SD[:k]
+        self.projectedWeights = s.get('projectedWeights')   # Not always present
+        if self.projectedWeights is not None and self.projectedWeights.ndim == 2:
+            self.projectedWeights = self.projectedWeights[:, :k]
+        if k < self.total_modes:
+            print("Using {0} of {1} modes ({2:.1f}% of variance)".format(k, self.total_modes,
+                                                                       100 * self.explained_variance))
+        # (K x N x 3) variance scaled modes used by every reconstruction path,
+        # float64 arrays are kept for export when viewing in float32
+        self.mean64 = np.asarray(self.mean, dtype=np.float64)
+        self.mean = self.mean64
+        if 'scaled_modes' in s:
+            self.scaled_modes64 = s['scaled_modes'][:k]
+        elif 'quantized_modes' in s:
+            # the int16 block stays memory mapped, modes are dequantized when reconstructing
+            self.scaled_modes64 = ssmb.QuantizedModes(s['quantized_modes'][:k], s['scales'][:k])
+        else:
+            self.scaled_modes64 = self.load_scaled_modes(s['modes'], s['weights'], k)
+        self.scaled_modes = self.scaled_modes64
+        self.set_precision(precision)
+
+    @staticmethod
+    def number_of_modes(weights, n_modes=None, variance=None):
+        """
+        Number of leading modes, fixed or reaching a cumulative fraction of the variance
+        """
+        k = weights.shape[0]
+        if variance is not None and variance < 1:
+            cumulative = np.cumsum(weights) / np.sum(weights)
+            k = min(k, int(np.searchsorted(cumulative, variance)) + 1)
+        if n_modes is not None:
+            k = min(k, max(1, int(n_modes)))
+        return k
+
+    def load_arrays(self, pc, use_cache=True):
+        """
+        Load the model arrays, memory mapped from the sidecar cache when possible
+        """
+        if use_cache:
+            cache = ShapeModelCache(pc)
+            try:
+                s = cache.load_arrays()
+                self.cache = cache
+                return s
+            except OSError as e:
+                print("Unable to use cache for {0}: {1}".format(pc, e))
+        s = np.load(pc, encoding='bytes', allow_pickle=True)
+        names = s.files if hasattr(s, 'files') else list(s.keys())
+        return {n: s[n] for n in names}
+
+    @staticmethod
+    def scale_modes(modes, weights, chunk_size=16):
+        """
+        modes * sqrt(weights) as a C-contiguous (K x N x 3) array, one contiguous block per mode
+        """
+        k = weights.shape[0]
+        scaled = np.empty([k, modes.shape[0]], dtype=np.float64)
+        sqrt_weights = np.sqrt(weights)
+        for i in range(0, k, chunk_size):
+            scaled[i: i + chunk_size] = modes[:, i: i + chunk_size].T * sqrt_weights[i: i + chunk_size, None]
+        return scaled.reshape([k, -1, 3])
+
+    def load_scaled_modes(self, modes, weights, k):
+        """
+        Scaled modes from the sidecar cache, or computed for the leading k modes
+        """
+        if self.cache is not None:
+            scaled = self.cache.load('scaled_modes')
+            if scaled is None:
+                try:
+                    self.cache.save('scaled_modes', ShapeModel.scale_modes(modes, weights))
+                    scaled = self.cache.load('scaled_modes')
+                except OSError as e:
+                    print("Unable to cache scaled modes: {0}".format(e))
+            if scaled is not None:
+                return scaled[:k]
+        return ShapeModel.scale_modes(modes[:, :k], weights[:k])
+
+    def set_precision(self, precision='float64'):
+        """
+        Reconstruct with the float64 or contiguous float32 arrays
+        """
+        if precision not in ShapeModel.precisions:
+            raise ValueError("Unknown precision: {0}".format(precision))
+        self.mean, self.scaled_modes = self.arrays(precision)
+        self.precision = precision
+
+    def arrays(self, precision=None):
+        """
+        :return: mean (3N) and scaled modes (K x N x 3), in the current precision if precision is None
+        """
+        if precision is None or precision == self.precision:
+            return self.mean, self.scaled_modes
+        if precision == 'float32':
+            mean = np.ascontiguousarray(self.mean64, dtype=np.float32)
+            if isinstance(self.scaled_modes64, ssmb.QuantizedModes):
+                return mean, self.scaled_modes64.astype(np.float32)
+            return mean, np.ascontiguousarray(self.scaled_modes64, dtype=np.float32)
+        return self.mean64, self.scaled_modes64
+
+    def precision_check(self, sd_range=3.0, chunk_size=16):
+        """
+        Maximum vertex deviation between float32 and float64 reconstructions at +/- sd_range
+        """
+        k = self.weights.shape[0]
+        sds = np.vstack([np.eye(k), -np.eye(k), np.ones([1, k]), -np.ones([1, k])]) * sd_range
+        # converted once, not for every chunk
+        mean64, scaled_modes64 = self.arrays('float64')
+        mean32, scaled_modes32 = self.arrays('float32')
+        deviation = 0.0
+        for i in range(0, sds.shape[0], chunk_size):
+            a = ShapeModel.combine(mean64, scaled_modes64, sds[i: i + chunk_size])
+            b = ShapeModel.combine(mean32, scaled_modes32, sds[i: i + chunk_size])
+            deviation = max(deviation, float(np.max(np.linalg.norm(a - b, axis=2))))
+        self.precision_deviation = deviation
+        return deviation
+
+    def reconstruct_diff_all(self, sd, add_mean=False, precision=None):
+        mean, scaled_modes = self.arrays(precision)
+        return ShapeModel.combine(mean, scaled_modes, np.asarray(sd)[None], add_mean)[0]
+
+    def reconstruct_batch(self, sds, add_mean=True, out=None, precision=None):
+        """
+        Reconstruct (M x K) sd vectors with a single matrix-matrix product
+        :return: (M x N x 3) array of vertices
+        """
+        mean, scaled_modes = self.arrays(precision)
+        return ShapeModel.combine(mean, scaled_modes, sds, add_mean, out)
+
+    @staticmethod
+    def combine(mean, scaled_modes, sds, add_mean=True, out=None):
+        """
+        reconstruct_batch on given arrays, e.g. as returned by arrays()
+        """
+        sds = np.atleast_2d(np.asarray(sds, dtype=scaled_modes.dtype))
+        k = sds.shape[1]
+        n = int(mean.shape[0] / 3)
+        if out is None:
+            out = np.empty([sds.shape[0], n, 3], dtype=mean.dtype)
+        flat = out.reshape(sds.shape[0], -1)
+        ShapeModel.product(sds, scaled_modes, flat)
         if add_mean:
-            me = m + self.mean
-        mesh = np.reshape(me, [int(self.mean.shape[0] / 3), 3])
-        return mesh
+            flat += mean
+        return out
+
+    @staticmethod
+    def mode_blocks(scaled_modes, k=None):
+        """
+        :return: generator of (first mode, (b x 3N) block of modes), quantized modes are dequantized a block at a time
+        """
+        k = scaled_modes.shape[0] if k is None else k
+        if isinstance(scaled_modes, ssmb.QuantizedModes):
+            yield from scaled_modes.blocks(k)
+        else:
+            yield 0, scaled_modes[:k].reshape([k, -1])
+
+    @staticmethod
+    def product(sds, scaled_modes, out):
+        """
+        out = sds . scaled_modes
+        """
+        scratch = None
+        for i, block in ShapeModel.mode_blocks(scaled_modes, sds.shape[1]):
+            if i == 0:
+                np.matmul(sds[:, :block.shape[0]], block, out=out)
+                continue
+            if scratch is None:
+                scratch = np.empty_like(out)
+            np.matmul(sds[:, i: i + block.shape[0]], block, out=scratch)
+            out += scratch
+        return out
+
+    def iter_reconstruct_batch(self, sds, chunk_size=256, add_mean=True, copy=False):
+        """
+        Reconstruct sd vectors in chunks of chunk_size shapes
+        :param copy: yield a new array per chunk, otherwise each chunk is overwritten by the next one
+        :return: generator of (start index, (m x N x 3) array)
+        """
+        sds = np.atleast_2d(sds)
+        n = int(self.mean.shape[0] / 3)
+        buffer = None
+        if not copy:
+            buffer = np.empty([min(chunk_size, sds.shape[0]), n, 3], dtype=self.mean.dtype)
+        for i in range(0, sds.shape[0], chunk_size):
+            chunk = sds[i: i + chunk_size]
+            out = None if copy else buffer[:chunk.shape[0]]
+            yield i, self.reconstruct_batch(chunk, add_mean, out=out)
+
+    def project(self, meshes, n_modes=None, chunk_size=256, precision='float64'):
+        """
+        Project corresponded meshes into PC space (the inverse of reconstruct_diff_all)
+        :return: sd vectors (M x K) and residual norms (M)
+        """
+        if isinstance(meshes, str):
+            meshes = [meshes]
+        if isinstance(meshes, np.ndarray) and meshes.ndim == 2:
+            meshes = meshes[None]
+        mean, scaled_modes = self.arrays(precision)
+        k = self.weights.shape[0] if n_modes is None else min(n_modes, self.weights.shape[0])
+        weights = self.weights[:k].astype(mean.dtype)
+        sds = np.empty([len(meshes), k], dtype=mean.dtype)
+        residuals = np.empty(len(meshes), dtype=mean.dtype)
+        block = np.empty([min(chunk_size, len(meshes)), mean.shape[0]], dtype=mean.dtype)
+        fitted = np.empty_like(block)
+        for start in range(0, len(meshes), chunk_size):
+            chunk = meshes[start: start + chunk_size]
+            m = len(chunk)
+            for i in range(m):
+                x = chunk[i]
+                if isinstance(x, str):
+                    x = read_mesh(x)[0]
+                block[i] = np.reshape(x, -1)
+            d = block[:m]
+            d -= mean
+            for i, basis in ShapeModel.mode_blocks(scaled_modes, k):
+                np.matmul(d, basis.T, out=sds[start: start + m, i: i + basis.shape[0]])
+            sds[start: start + m] /= weights
+            # |d - fit| directly, |d|^2 - |fit|^2 loses the residual of shapes close to the model span
+            ShapeModel.product(sds[start: start + m], scaled_modes, fitted[:m])
+            d -= fitted[:m]
+            residuals[start: start + m] = np.sqrt(np.einsum('ij,ij->i', d, d))
+        return sds, residuals
+
+    def sample(self, n, block_size=1024, seed=None, max_radius=None, n_modes=None, max_tries=1000):
+        """
+        Draw sd vectors from the model's Gaussian, optionally truncated at max_radius
+        :return: generator of (start index, (m x K) sd block)
+        """
+        rng = np.random.default_rng(seed)
+        k = self.weights.shape[0] if n_modes is None else min(n_modes, self.weights.shape[0])
+        for start in range(0, n, block_size):
+            m = min(block_size, n - start)
+            sds = rng.standard_normal([m, k])
+            if max_radius is not None:
+                reject = np.linalg.norm(sds, axis=1) > max_radius
+                tries = 0
+                while np.any(reject):
+                    tries += 1
+                    if tries > max_tries:
+                        raise ValueError("Mahalanobis radius {0} is too small for {1} modes".format(max_radius, k))
+                    sds[reject] = rng.standard_normal([np.count_nonzero(reject), k])
+                    reject = np.linalg.norm(sds, axis=1) > max_radius
+            yield start, sds
+
+    def generate_cohort(self, n, filename, block_size=1024, seed=None, max_radius=None, n_modes=None,
+                        progress=None, dtype=np.float32, chunk_bytes=2 ** 22):
+        """
+        Stream a synthetic cohort to <filename>_shapes.npy and <filename>_sd.npy, or to a .h5 file
+        :return: list of files written
+        """
+        k = self.weights.shape[0] if n_modes is None else min(n_modes, self.weights.shape[0])
+        v = int(self.mean.shape[0] / 3)
+        if filename.endswith('.h5'):
+            import h5py
+            # chunk rows from a byte budget, not block_size, a chunk of large meshes would be too big
+            shape_rows = int(max(1, min(n, chunk_bytes // (v * 3 * np.dtype(dtype).itemsize))))
+            sd_rows = int(max(1, min(n, chunk_bytes // (k * 8))))
+            with h5py.File(filename, "w") as f:
+                shapes = f.create_dataset('shapes', shape=(n, v, 3), dtype=dtype, chunks=(shape_rows, v, 3))
+                sd_out = f.create_dataset('sd', shape=(n, k), dtype=np.float64, chunks=(sd_rows, k))
+                buffer = np.empty([min(block_size, n), v, 3], dtype=dtype)
+                for start, sds in self.sample(n, block_size, seed, max_radius, k):
+                    m = sds.shape[0]
+                    shapes[start: start + m] = self.reconstruct_batch(sds, out=buffer[:m])
+                    sd_out[start: start + m] = sds
+                    if progress is not None:
+                        progress(start + m, n)
+            return [filename]
+        shapes_file = filename + "_shapes.npy"
+        sd_file = filename + "_sd.npy"
+        shapes = np.lib.format.open_memmap(shapes_file, mode='w+', dtype=dtype, shape=(n, v, 3))
+        sd_out = np.lib.format.open_memmap(sd_file, mode='w+', dtype=np.float64, shape=(n, k))
+        for start, sds in self.sample(n, block_size, seed, max_radius, k):
+            m = sds.shape[0]
+            self.reconstruct_batch(sds, out=shapes[start: start + m])
+            sd_out[start: start + m] = sds
+            shapes.flush()
+            if progress is not None:
+                progress(start + m, n)
+        sd_out.flush()
+        del shapes, sd_out
+        return [shapes_file, sd_file]
 
     def reconstruct_diff(self, pc, sd=0, part=None, debug=False, add_mean=False):
         if part is None:
             return None
-        w = sd * np.sqrt(self.weights[pc])
-        m = w * self.modes[:, pc]
-        me = m
+        # only the rows of the part are reconstructed
+        idm = part["idm"].to_numpy()
+        export = sd * self.scaled_modes[pc][idm]
         if add_mean:
-            me = m + self.mean
-        mesh = np.reshape(me, [int(self.mean.shape[0] / 3), 3])
-        export = mesh[part["idm"].to_list(), :]
+            export += np.reshape(self.mean, [-1, 3])[idm]
         if debug:
             if not os.path.exists("./meshes/temp/"):
                 os.makedirs("./meshes/temp/")
@@ -58,73 +364,272 @@ class ShapeModel:
 
         return export
 
+    @staticmethod
+    def mode_influence(scaled_modes, chunk_size=16):
+        """
+        :return: (K x N) per vertex norm of each scaled mode
+        """
+        k, n = scaled_modes.shape[:2]
+        influence = np.empty([k, n], dtype=np.float32)
+        for i in range(0, k, chunk_size):
+            block = np.asarray(scaled_modes[i: i + chunk_size], dtype=np.float64)
+            influence[i: i + chunk_size] = np.sqrt(np.einsum('kij,kij->ki', block, block))
+        return influence
+
+    def load_influence(self):
+        """
+        Influence maps and per vertex SD from the sidecar cache, or computed for the leading modes
+        """
+        k = self.scaled_modes64.shape[0]
+        if self.cache is not None:
+            influence = self.cache.load('influence')
+            vertex_sd = self.cache.load('vertex_sd')
+            if influence is None or vertex_sd is None:
+                scaled = self.cache.load('scaled_modes')
+                if scaled is None or scaled.shape[0] != self.total_modes:
+                    scaled = self.scaled_modes64
+                try:
+                    influence = ShapeModel.mode_influence(scaled)
+                    vertex_sd = np.sqrt(np.sum(np.square(influence, dtype=np.float64), axis=0))
+                    if scaled.shape[0] == self.total_modes:
+                        self.cache.save('influence', influence)
+                        self.cache.save('vertex_sd', vertex_sd)
+                        influence = self.cache.load('influence')
+                        vertex_sd = self.cache.load('vertex_sd')
+                except OSError as e:
+                    print("Unable to cache influence maps: {0}".format(e))
+            if influence is not None and influence.shape[0] >= k:
+                if k < influence.shape[0]:
+                    vertex_sd = np.sqrt(np.sum(np.square(influence[:k], dtype=np.float64), axis=0))
+                return influence[:k], vertex_sd
+        influence = ShapeModel.mode_influence(self.scaled_modes64)
+        return influence, np.sqrt(np.sum(np.square(influence, dtype=np.float64), axis=0))
+
+    def influence_maps(self):
+        """
+        :return: (K x N) per vertex displacement of each mode at +1 SD
+        """
+        if self.influence is None:
+            self.influence, self.sd_field = self.load_influence()
+        return self.influence
+
+    def vertex_sd(self):
+        """
+        :return: (N) per vertex standard deviation of the displacement over all modes
+        """
+        if self.sd_field is None:
+            self.influence, self.sd_field = self.load_influence()
+        return self.sd_field
+
+    def mode_matrix(self):
+        """
+        :return: (3N x K) orthonormal modes, derived from the scaled modes if they were not loaded
+        """
+        if self.modes is not None:
+            return self.modes
+        k = self.scaled_modes64.shape[0]
+        return (np.asarray(self.scaled_modes64).reshape([k, -1]) / np.sqrt(self.weights)[:, None]).T
+
+    def save(self, filename):
+        """
+        Write the model as a gias style .pc.npz
+        """
+        s = {'mean': np.asarray(self.mean64, dtype=np.float64), 'weights': self.weights,
+             'modes': np.ascontiguousarray(self.mode_matrix())}
+        if self.SD is not None:
+            s['SD'] = self.SD
+        if self.projectedWeights is not None:
+            s['projectedWeights'] = self.projectedWeights
+        np.savez(filename, **s)
+
+    def save_project(self, prefix, faces):
+        """
+        Write <prefix>.pc.npz, <prefix>.ply and <prefix>.ssm
+        :return: path of the .ssm file
+        """
+        pc = prefix + ".pc.npz"
+        ply = prefix + ".ply"
+        project = prefix + ".ssm"
+        self.save(pc)
+        write_ply(ply, np.reshape(self.mean64, [-1, 3]), faces)
+        with open(project, "w") as f:
+            json.dump({'pc': os.path.abspath(pc), 'mean_mesh': os.path.abspath(ply)}, f, indent=4)
+        return project
+
+    @staticmethod
+    def orthonormalise(scaled_modes, tol=1e-10):
+        """
+        Orthonormal PCA basis of the covariance of a set of scaled modes
+        :return: weights (K'), modes (3N x K'), scaled modes (K' x N x 3)
+        """
+        k = scaled_modes.shape[0]
+        u, sv, _ = np.linalg.svd(scaled_modes.reshape([k, -1]).T, full_matrices=False)
+        keep = sv > tol * sv[0]
+        u = u[:, keep]
+        sv = sv[keep]
+        scaled = np.ascontiguousarray((u * sv).T).reshape([sv.shape[0], -1, 3])
+        return sv ** 2, u, scaled
+
+    def subset(self, vertex_ids):
+        """
+        Model of a subset of the vertices in the same PC basis, e.g. for a level of detail proxy
+        """
+        vertex_ids = np.asarray(vertex_ids)
+        mean = np.reshape(self.mean64, [-1, 3])[vertex_ids].ravel()
+        scaled = np.ascontiguousarray(self.scaled_modes64[:, vertex_ids, :])
+        return ShapeModel.from_arrays(mean, self.weights, scaled_modes=scaled, precision=self.precision)
+
+    def extract_region(self, vertex_ids, faces=None):
+        """
+        Standalone, re-orthonormalised model of a region of this model
+        :return: ShapeModel of the region and its faces (None if faces is None)
+        """
+        n = int(self.mean64.shape[0] / 3)
+        mask = np.zeros(n, dtype=bool)
+        mask[np.asarray(vertex_ids)] = True
+        mean = np.reshape(self.mean64, [-1, 3])[mask].ravel()
+        weights, modes, scaled = ShapeModel.orthonormalise(self.scaled_modes64[:, mask, :])
+        region = ShapeModel.from_arrays(mean, weights, modes, scaled, precision=self.precision)
+        region_faces = None
+        if faces is not None:
+            region_faces = sub_mesh_faces(faces, mask)
+        return region, region_faces
+
+    def resample(self, indices, weights, orthonormal=False, chunk_size=16):
+        """
+        Model on barycentric combinations of the vertices of this model, keeping the mode order
+        :param orthonormal: re-orthonormalise the interpolated modes, needed for project()
+        """
+        mean = np.einsum('mj,mji->mi', weights, np.reshape(self.mean64, [-1, 3])[indices]).ravel()
+        k = self.scaled_modes64.shape[0]
+        scaled = np.empty([k, indices.shape[0], 3])
+        for i in range(0, k, chunk_size):
+            block = np.asarray(self.scaled_modes64[i: i + chunk_size], dtype=np.float64)
+            scaled[i: i + chunk_size] = np.einsum('mj,kmji->kmi', weights, block[:, indices])
+        if not orthonormal:
+            return ShapeModel.from_arrays(mean, self.weights, scaled_modes=scaled, precision=self.precision)
+        q, r = np.linalg.qr(scaled.reshape([k, -1]).T)
+        norms = np.abs(np.diag(r))
+        q *= np.where(np.diag(r) < 0, -1.0, 1.0)    # positive projection on the interpolated mode
+        scaled = np.ascontiguousarray((q * norms).T).reshape([k, -1, 3])
+        return ShapeModel.from_arrays(mean, norms ** 2, q, scaled, precision=self.precision)
 
+    def decimate(self, faces, reduction=0.9, n_samples=10, seed=None, orthonormal=False):
+        """
+        Reduced resolution model on the decimated mean mesh (see resample)
+        :return: reduced ShapeModel, its faces and a dict of the errors
+        """
+        points = np.reshape(self.mean64, [-1, 3])
+        new_points, new_faces = decimate_quadric(points, faces, reduction)
+        indices, weights = barycentric_transfer(points, faces, new_points)
+        reduced = self.resample(indices, weights, orthonormal)
+
+        rng = np.random.default_rng(seed)
+        sds = np.zeros([n_samples + 1, self.weights.shape[0]])
+        sds[1:] = np.clip(rng.standard_normal([n_samples, self.weights.shape[0]]), -3.0, 3.0)
+        shapes = self.reconstruct_batch(sds, precision='float64')
+        reduced_shapes = reduced.reconstruct_batch(sds, precision='float64')
+        used = np.unique(faces)     # vertices outside the surface are not approximated by it
+        distances = np.empty([sds.shape[0], used.shape[0]])
+        for i in range(sds.shape[0]):
+            distances[i] = surface_distance(reduced_shapes[i], new_faces, shapes[i][used])
+        error = {'max_error_mean': float(np.max(distances[0])),
+                 'max_error': float(np.max(distances)),
+                 'rms_error': float(np.sqrt(np.mean(np.square(distances))))}
+        return reduced, new_faces, error
+
+    def save_ssmb(self, filename, sd_range=3.0):
+        """
+        Write the model as a compact quantized .ssmb file
+        :return: reconstruction error report at +/- sd_range
+        """
+        error = ssmb.write_ssmb(filename, self.mean64, self.weights, self.scaled_modes64, sd_range)
+        print("ssmb max error at {0} SD: {1}".format(sd_range, error))
+        return error
+
+    def incremental(self, refresh_every=64, out=None):
+        """
+        :return: IncrementalReconstruction of this model
+        """
+        return IncrementalReconstruction(self, refresh_every=refresh_every, out=out)
+
+
+class IncrementalReconstruction:
+    """
+    Current shape in a persistent (N x 3) buffer, updated in O(N) when a single PC moves
+    """
+    def __init__(self, shape_model: ShapeModel, refresh_every=64, out=None):
+        self.shape_model = shape_model
+        self.refresh_every = refresh_every
+        k = shape_model.scaled_modes.shape[0]
+        self.mean = shape_model.mean
+        self.quantized = isinstance(shape_model.scaled_modes, ssmb.QuantizedModes)
+        if self.quantized:
+            self.scaled_modes = shape_model.scaled_modes     # rows dequantized on use
+        else:
+            self.scaled_modes = shape_model.scaled_modes.reshape([k, -1])     # (K x 3N) view
+        self.sd = np.zeros(k, dtype=self.scaled_modes.dtype)
+        n = int(shape_model.mean.shape[0] / 3)
+        if out is None:
+            out = np.empty([n, 3], dtype=shape_model.mean.dtype)
+        self.buffer = out
+        self.flat = self.buffer.reshape(-1)     # view, shares memory with buffer
+        self.scratch = np.empty_like(self.flat)
+        self.updates = 0
+        self.reset()
+
+    def reset(self, sd=None):
+        """
+        Full recompute of the buffer
+        """
+        if sd is not None:
+            self.sd[:] = sd
+        ShapeModel.product(self.sd[None], self.scaled_modes, self.flat[None])
+        self.flat += self.mean
+        self.updates = 0
+        return self.buffer
+
+    def copy(self, out=None):
+        """
+        Engine on the same model arrays in the same state, with its own buffers
+        """
+        engine = IncrementalReconstruction.__new__(IncrementalReconstruction)
+        engine.__dict__.update(self.__dict__)
+        engine.buffer = np.empty_like(self.buffer) if out is None else out
+        np.copyto(engine.buffer, self.buffer)
+        engine.flat = engine.buffer.reshape(-1)
+        engine.scratch = np.empty_like(self.scratch)
+        engine.sd = self.sd.copy()
+        return engine
+
+    def update(self, pc, sd):
+        """
+        Rank-1 update of the buffer for a single PC
+        :return: the (N x 3) buffer
+        """
+        delta = sd - self.sd[pc]
+        if delta == 0:
+            return self.buffer
+        self.sd[pc] = sd
+        self.updates += 1
+        if self.updates >= self.refresh_every:     # full recompute to stop floating-point drift
+            return self.reset()
+        if self.quantized:
+            self.scaled_modes.row(pc, self.scratch, delta)
+        else:
+            np.multiply(self.scaled_modes[pc], delta, out=self.scratch)
+        self.flat += self.scratch
+        return self.buffer
 
-    # def create_part(self, color, force_build, mean_mesh, part_map):
-    #     mesh = np.reshape(self.mean, [int(self.mean.shape[0] / 3), 3])
-    #     part = mesh[part_map, :]
-    #     new_shape = None
-    #     if force_build or not os.path.exists(mean_mesh):
-    #         new_shape = self.extract_parts(part_map)
-    #         # Write the mesh to file "*.ply"
-    #         w = vtk.vtkPLYWriter()
-    #         w.SetInputData(new_shape[0])
-    #         w.SetFileName(mean_mesh)
-    #         w.Write()
-    #     if force_build:
-    #         polydata = new_shape[0]
-    #     else:
-    #         reader = vtk.vtkPLYReader()
-    #         reader.SetFileName(mean_mesh)
-    #         reader.Update()
-    #         polydata = reader.GetOutput()
-    #     mapper = vtk.vtkPolyDataMapper()
-    #     if vtk.VTK_MAJOR_VERSION <= 5:
-    #         # mapper.SetInput(reader.GetOutput())
-    #         mapper.SetInput(polydata)
-    #     else:
-    #         mapper.SetInputData(polydata)
-    #     actor = vtk.vtkActor()
-    #     actor.SetMapper(mapper)
-    #     actor.GetProperty().SetColor(color[0], color[1], color[2])
-    #     return {Keywords.actor: actor, Keywords.polydata: polydata, Keywords.vertices: part}
-    #
-    # @staticmethod
-    # def clean_poly_data(polydata):
-    #
-    #     # Create a vtkCleanPolyData filter
-    #     clean_filter = vtk.vtkCleanPolyData()
-    #     clean_filter.SetInputData(polydata)
-    #
-    #     # Update the filter to remove duplicate points
-    #     clean_filter.Update()
-    #
-    #     # Get the cleaned polydata output
-    #     cleaned_polydata = clean_filter.GetOutput()
-    #
-    #     return cleaned_polydata
-    #
-    # def extract_parts(self, node_id_list, export_vert=True):
-    #     mesh_data_copy = vtk.vtkPolyData()
-    #     mesh_org = self.mean_mesh['polydata']
-    #     mesh_data_copy.DeepCopy(mesh_org)
-    #     cell_data = mesh_data_copy.GetPolys()
-    #     vertices = None
-    #     if export_vert:
-    #         # Get the point data and cell data of the mesh
-    #         points_l = []
-    #         for i in range(len(node_id_list)):
-    #             p = mesh_data_copy.GetPoint(node_id_list[i])
-    #             points_l.append(p)
-    #         vertices = np.array(points_l)
-    #
-    #     for i in range(cell_data.GetNumberOfCells()):
-    #         cell = mesh_data_copy.GetCell(i)
-    #         p1 = cell.GetPointId(0)
-    #         p2 = cell.GetPointId(1)
-    #         p3 = cell.GetPointId(2)
-    #         if not (p1 in node_id_list and p2 in node_id_list and p3 in node_id_list):
-    #             mesh_data_copy.DeleteCell(i)
-    #     mesh_data_copy.RemoveDeletedCells()
-    #
-    #     return [mesh_data_copy, vertices]
\ No newline at end of file
+    def update_sd(self, sd):
+        """
+        Bring the buffer to a new sd vector
+        :return: the (N x 3) buffer
+        """
+        sd = np.asarray(sd, dtype=self.sd.dtype)
+        changed = np.flatnonzero(sd != self.sd)
+        if changed.shape[0] * 4 > self.sd.shape[0]:
+            return self.reset(sd)
+        for pc in changed:
+            self.update(pc, sd[pc])
+        return self.buffer
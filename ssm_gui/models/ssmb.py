@@ -0,0 +1,167 @@
+"""
+Compact quantized SSM container (.ssmb)
+"""
+
+import json
+import struct
+
+import numpy as np
+
+# b"SSMB", uint32 version, uint32 header length, JSON header padded to 64 bytes, then 64 byte aligned
+# blocks: mean float32 (3N), weights float64 (K), scales float32 (K) and
+# quantized_modes int16 (K x N x 3) = round(modes * sqrt(weights) / scale)
+magic = b"SSMB"
+version = 1
+alignment = 64
+preamble = struct.Struct("<4sII")
+
+
+def align(n):
+    return int(np.ceil(n / alignment) * alignment)
+
+
+def quantize(scaled_modes):
+    """
+    Quantize (K x N x 3) scaled modes to int16 with one scale per mode
+    :return: quantized modes (int16), scales (float32)
+    """
+    k = scaled_modes.shape[0]
+    q = np.empty(scaled_modes.shape, dtype=np.int16)
+    scales = np.empty(k, dtype=np.float32)
+    for i in range(k):
+        mode = np.asarray(scaled_modes[i])
+        peak = np.max(np.abs(mode))
+        scales[i] = (peak if peak > 0 else 1.0) / 32767.0
+        q[i] = np.round(mode / scales[i])
+    return q, scales
+
+
+class QuantizedModes:
+    """
+    (K x N x 3) scaled modes kept as int16 with per mode scales, dequantized a block at a time
+    """
+    def __init__(self, quantized, scales, dtype=np.float64, block_bytes=2 ** 23):
+        self.quantized = quantized
+        self.scales = np.asarray(scales)
+        self.dtype = np.dtype(dtype)
+        self.block_bytes = block_bytes
+
+    @property
+    def shape(self):
+        return self.quantized.shape
+
+    @property
+    def ndim(self):
+        return self.quantized.ndim
+
+    def __len__(self):
+        return self.quantized.shape[0]
+
+    def astype(self, dtype):
+        return QuantizedModes(self.quantized, self.scales, dtype, self.block_bytes)
+
+    def __getitem__(self, item):
+        rows = item[0] if isinstance(item, tuple) else item
+        q = self.quantized[item]
+        scales = self.scales[rows].astype(self.dtype)
+        if scales.ndim > 0:
+            scales = scales.reshape([-1] + [1] * (q.ndim - 1))
+        return np.multiply(q, scales, dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        a = self[:]
+        return a if dtype is None else a.astype(dtype)
+
+    def blocks(self, k=None):
+        """
+        :param k: number of leading modes, defaults to all
+        :return: generator of (first mode, (b x 3N) dequantized block)
+        """
+        k = self.shape[0] if k is None else k
+        row_bytes = int(np.prod(self.shape[1:])) * self.dtype.itemsize
+        b = max(1, self.block_bytes // row_bytes)
+        for i in range(0, k, b):
+            block = self[i: min(i + b, k)]
+            yield i, block.reshape([block.shape[0], -1])
+
+    def row(self, i, out, factor=1.0):
+        """
+        Write mode i * factor, flattened, into out (3N)
+        """
+        np.multiply(self.quantized[i].reshape(-1), self.dtype.type(self.scales[i] * factor), out=out)
+        return out
+
+
+def quantization_error(scaled_modes, quantized_modes, scales, mean=None, sd_range=3.0):
+    """
+    Maximum vertex error introduced by the format at +/- sd_range
+    """
+    k = scaled_modes.shape[0]
+    per_mode = 0.0
+    combined = np.zeros(scaled_modes.shape[1])
+    for i in range(k):
+        e = np.linalg.norm(scaled_modes[i] - quantized_modes[i] * np.float64(scales[i]), axis=1) * sd_range
+        per_mode = max(per_mode, float(np.max(e)))
+        combined += e
+    ret = {'sd_range': sd_range, 'max_error_single_mode': per_mode, 'max_error_all_modes': float(np.max(combined))}
+    if mean is not None:
+        m = np.reshape(mean, [-1, 3])
+        ret['max_error_mean'] = float(np.max(np.linalg.norm(m - m.astype(np.float32), axis=1)))
+    return ret
+
+
+def write_ssmb(filename, mean, weights, scaled_modes, sd_range=3.0):
+    """
+    Write a .ssmb file
+    :return: error report (also stored in the header)
+    """
+    q, scales = quantize(scaled_modes)
+    error = quantization_error(scaled_modes, q, scales, mean, sd_range)
+    blocks = [('mean', np.ascontiguousarray(mean, dtype=np.float32)),
+              ('weights', np.ascontiguousarray(weights, dtype=np.float64)),
+              ('scales', scales),
+              ('quantized_modes', q)]
+    header = {'format': 'ssmb', 'version': version,
+              'vertices': int(scaled_modes.shape[1]), 'modes': int(scaled_modes.shape[0]),
+              'error': error, 'blocks': {}}
+    # offsets depend on the header length, so size it first with placeholder offsets
+    for name, a in blocks:
+        header['blocks'][name] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': 0}
+    header_len = len(json.dumps(header, indent=2).encode('utf-8')) + 16 * len(blocks)
+    offset = align(preamble.size + header_len)
+    for name, a in blocks:
+        header['blocks'][name]['offset'] = offset
+        offset = align(offset + a.nbytes)
+    text = json.dumps(header, indent=2).encode('utf-8')
+    text += b" " * (header_len - len(text))
+    with open(filename, "wb") as f:
+        f.write(preamble.pack(magic, version, header_len))
+        f.write(text)
+        for name, a in blocks:
+            f.seek(header['blocks'][name]['offset'])
+            f.write(a.tobytes())
+        f.truncate(offset)
+    return error
+
+
+def read_header(filename):
+    with open(filename, "rb") as f:
+        m, v, header_len = preamble.unpack(f.read(preamble.size))
+        if m != magic:
+            raise ValueError("{0} is not a ssmb file".format(filename))
+        if v > version:
+            raise ValueError("Unsupported ssmb version {0}".format(v))
+        return json.loads(f.read(header_len).decode('utf-8'))
+
+
+def read_ssmb(filename):
+    """
+    Memory map the blocks of a .ssmb file
+    :return: dict of name -> np.memmap, plus 'header'
+    """
+    header = read_header(filename)
+    ret = {'header': header}
+    for name, b in header['blocks'].items():
+        ret[name] = np.memmap(filename, dtype=np.dtype(b['dtype']), mode='r', offset=b['offset'],
+                              shape=tuple(b['shape']))
+    return ret
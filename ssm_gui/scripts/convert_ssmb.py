@@ -0,0 +1,21 @@
+import argparse
+import os
+
+from ssm_gui.models.shape import ShapeModel
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a .pc.npz/.pc shape model to a quantized .ssmb file")
+    parser.add_argument('pc', help="input .pc.npz/.pc file")
+    parser.add_argument('out', nargs='?', default=None, help="output .ssmb file")
+    parser.add_argument('--sd', type=float, default=3.0, help="sd used to report the reconstruction error")
+    args = parser.parse_args()
+
+    out = args.out
+    if out is None:
+        out = args.pc[:args.pc.rindex('.pc')] + '.ssmb'
+    model = ShapeModel(args.pc)
+    error = model.save_ssmb(out, args.sd)
+    print("{0} -> {1}".format(args.pc, out))
+    print("size: {0:.1f} MB -> {1:.1f} MB".format(os.path.getsize(args.pc) / 1e6, os.path.getsize(out) / 1e6))
+    for e in error:
+        print("{0}: {1}".format(e, error[e]))
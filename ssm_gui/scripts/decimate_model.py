@@ -0,0 +1,28 @@
+import argparse
+
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.models.mesh import read_mesh
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Derive a reduced resolution shape model from a full resolution one")
+    parser.add_argument('pc', help="input .pc.npz/.pc/.ssmb file")
+    parser.add_argument('mean_mesh', help="mean mesh (.ply) of the model")
+    parser.add_argument('out', help="output prefix, writes <out>.pc.npz, <out>.ply and <out>.ssm")
+    parser.add_argument('--reduction', type=float, default=0.9, help="fraction of the triangles to remove (default 0.9)")
+    parser.add_argument('--samples', type=int, default=10, help="random shapes used to report the error (default 10)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--orthonormal', action='store_true',
+                        help="re-orthonormalise the reduced modes (keeps their order and sign, needed to project meshes)")
+    args = parser.parse_args()
+
+    model = ShapeModel(args.pc)
+    points, faces = read_mesh(args.mean_mesh)
+    reduced, reduced_faces, error = model.decimate(faces, args.reduction, args.samples, args.seed,
+                                                   args.orthonormal)
+    project = reduced.save_project(args.out, reduced_faces)
+    print("{0} -> {1} vertices, {2} faces, {3} modes -> {4}".format(points.shape[0], int(reduced.mean.shape[0] / 3),
+                                                                    reduced_faces.shape[0], reduced.weights.shape[0],
+                                                                    project))
+    print("distance to the reduced surface, mean shape max: {0:.4g}".format(error['max_error_mean']))
+    print("over {0} random shapes max: {1:.4g}, rms: {2:.4g}".format(args.samples, error['max_error'],
+                                                                     error['rms_error']))
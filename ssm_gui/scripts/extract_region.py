@@ -0,0 +1,28 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.models.mesh import read_mesh
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract a standalone sub-model (e.g. the glenoid) from a shape model")
+    parser.add_argument('pc', help="input .pc.npz/.pc/.ssmb file")
+    parser.add_argument('mean_mesh', help="mean mesh (.ply) of the model")
+    parser.add_argument('vertices', help="vertex indices of the region, csv with an 'idm' column or a .npy/.txt list")
+    parser.add_argument('out', help="output prefix, writes <out>.pc.npz, <out>.ply and <out>.ssm")
+    args = parser.parse_args()
+
+    if args.vertices.endswith('.csv'):
+        ids = pd.read_csv(args.vertices)['idm'].to_numpy()
+    elif args.vertices.endswith('.npy'):
+        ids = np.load(args.vertices)
+    else:
+        ids = np.loadtxt(args.vertices, dtype=int)
+    model = ShapeModel(args.pc)
+    points, faces = read_mesh(args.mean_mesh)
+    region, region_faces = model.extract_region(ids, faces)
+    project = region.save_project(args.out, region_faces)
+    print("{0} vertices, {1} faces, {2} modes -> {3}".format(int(region.mean.shape[0] / 3), region_faces.shape[0],
+                                                              region.weights.shape[0], project))
@@ -0,0 +1,24 @@
+import argparse
+
+from ssm_gui.models.shape import ShapeModel
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic cohort of shape instances from a shape model")
+    parser.add_argument('pc', help="input .pc.npz/.pc/.ssmb file")
+    parser.add_argument('out', help="output prefix (<out>_shapes.npy, <out>_sd.npy) or .h5 file")
+    parser.add_argument('-n', type=int, default=1000, help="number of instances")
+    parser.add_argument('--modes', type=int, default=None, help="number of leading modes to sample")
+    parser.add_argument('--radius', type=float, default=None, help="truncate at this Mahalanobis radius")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the random generator")
+    parser.add_argument('--block', type=int, default=1024, help="instances reconstructed at a time")
+    args = parser.parse_args()
+
+    def progress(done, n):
+        print("\r{0}/{1}".format(done, n), end="", flush=True)
+
+    model = ShapeModel(args.pc)
+    files = model.generate_cohort(args.n, args.out, block_size=args.block, seed=args.seed, max_radius=args.radius,
+                                  n_modes=args.modes, progress=progress)
+    print()
+    for f in files:
+        print(f)
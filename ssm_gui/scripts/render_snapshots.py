@@ -0,0 +1,47 @@
+import argparse
+import os
+
+import numpy as np
+
+from ssm_gui.util.offscreen import OffscreenRenderer, read_sd_csv, model_name
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render shape model instances to PNG offscreen (no display needed)")
+    parser.add_argument('projects', nargs='+', help=".ssm project files")
+    parser.add_argument('--out', default='.', help="output directory")
+    parser.add_argument('--sd', action='append', default=[],
+                        help="comma separated sd vector, e.g. 2,0,-1 (repeat for several shapes)")
+    parser.add_argument('--csv', default=None, help="csv file with one sd vector per row")
+    parser.add_argument('--views', default='+x,-x,+y,-y,+z,-z',
+                        help="comma separated camera presets out of +x,-x,+y,-y,+z,-z")
+    parser.add_argument('--size', default='1024x768', help="image size, WIDTHxHEIGHT")
+    parser.add_argument('--scale', type=int, default=1, help="supersampling factor of the image")
+    args = parser.parse_args()
+
+    views = [v.strip() for v in args.views.split(',') if v.strip()]
+    for v in views:
+        if v not in OffscreenRenderer.views:
+            parser.error("unknown view {0}".format(v))
+    sds = [None]    # the mean shape when no sd vector is given
+    if args.sd or args.csv:
+        sds = [np.array([float(x) for x in s.split(',')]) for s in args.sd]
+        if args.csv is not None:
+            csv_sds = read_sd_csv(args.csv)
+            if csv_sds.shape[0] == 0:
+                parser.error("no sd vectors in {0}".format(args.csv))
+            sds += list(csv_sds)
+    width, height = [int(x) for x in args.size.lower().split('x')]
+    os.makedirs(args.out, exist_ok=True)
+
+    renderer = OffscreenRenderer(width, height, args.scale)
+    for project in args.projects:
+        name = model_name(project)
+        shape_model, faces = OffscreenRenderer.load_project(project)
+        renderer.set_model(shape_model, faces)
+        for j, sd in enumerate(sds):
+            renderer.set_sd(sd)
+            for v in views:
+                png = os.path.join(args.out, "{0}_{1:03d}_{2}.png".format(name, j, v.replace('+', 'p').replace('-', 'm')))
+                renderer.snapshot(png, v)
+        print("{0}: {1} images".format(name, len(sds) * len(views)))
+    renderer.close()
@@ -4,21 +4,29 @@ from typing import Optional
 import time
 
 import numpy as np
-from PySide6.QtWidgets import (QMainWindow, QApplication, QMenuBar, QWidget, QVBoxLayout, QHBoxLayout, QMessageBox)
+import vtk
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from PySide6.QtWidgets import (QMainWindow, QApplication, QMenuBar, QWidget, QVBoxLayout, QHBoxLayout, QMessageBox,
+                               QProgressDialog)
 from PySide6.QtGui import QIcon, QColor
-from PySide6.QtCore import QSize, Qt, QEvent
+from PySide6.QtCore import QSize, Qt, QEvent, QTimer
 
-from ssm_gui.defaults.viewer import WorldView
+from ssm_gui.defaults.viewer import WorldView, WorldMenuWidget
 from ssm_gui.defaults.widgets import SSMInfoWidget, CameraWidget
 from ssm_gui.defaults.tools import BasicIO
 from ssm_gui.util.dialogs import NewSSM, Preference
 from ssm_gui.models.shape import ShapeModel
+from ssm_gui.models.mesh import (DisplacementScalars, VertexNormals, point_normals, decimate, poly_to_arrays,
+                                 set_vtk_buffer)
+from ssm_gui.util.reconstruction import ReconstructionThread
+from ssm_gui.util.animation import SweepKeyframes
+from ssm_gui.util.loader import ProjectLoader, MeshLoader
+from ssm_gui.models.cache import MeshCache
 from ssm_gui.__init__  import __version__, __dev_state__, __build_date__, resource_path
 
 
 from ptb.util.io.helper import JSONSUtl
 from ptb.util.io.opendialog import OpenFiles
-from ptb.util.data import VTKMeshUtl
 
 from threading import Thread
 
@@ -110,16 +118,100 @@ class SSMConfig(CustomConfig):
         self.model_connector:ModelConnector = None
         self.root = main
         self.current_file = None
+        self.loader: ProjectLoader = None
+        self.loaders = []   # cancelled loaders still finishing in the background
+        self.progress_dialog = None
 
-    def update_model_connector(self):
+    def update_model_connector(self, loader=None):
         self.model_connector.shape_model = self.shape_model
         self.model_connector.mean_mesh_file = self.geo
-        self.model_connector.update_world(True)
+        if loader is None:
+            self.model_connector.update_world(True)
+        else:
+            self.model_connector.update_world(True, loader.poly, loader.mesh_cache, loader.proxy, loader.proxy_model,
+                                              loader.engines)
+
+    def open_project(self, pc, mean_mesh, n_modes=None, variance=None):
+        """
+        Load the project in the background, the view is updated in on_project_loaded
+        """
+        self.cancel_load()
+        connector = self.model_connector
+        self.loader = ProjectLoader(pc, mean_mesh, n_modes, variance, connector.lod_min_points, connector.lod_reduction,
+                                    connector.precision)
+        self.loader.progress.connect(self.on_load_progress, Qt.ConnectionType.QueuedConnection)
+        self.loader.loaded.connect(self.on_project_loaded, Qt.ConnectionType.QueuedConnection)
+        self.loader.failed.connect(self.on_load_failed, Qt.ConnectionType.QueuedConnection)
+        self.progress_dialog = QProgressDialog("Opening {0}".format(os.path.basename(pc)), "Cancel", 0, 100,
+                                               self.root)
+        self.progress_dialog.setWindowTitle("Open")
+        self.progress_dialog.setMinimumDuration(300)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setAutoReset(False)
+        self.progress_dialog.canceled.connect(self.cancel_load)
+        self.progress_dialog.setValue(0)
+        self.loader.start()
+
+    def on_load_progress(self, value, message):
+        if self.progress_dialog is not None:
+            self.progress_dialog.setLabelText(message)
+            self.progress_dialog.setValue(value)
+
+    def close_progress(self):
+        if self.progress_dialog is not None:
+            self.progress_dialog.canceled.disconnect(self.cancel_load)
+            self.progress_dialog.close()
+            self.progress_dialog = None
+
+    def cancel_load(self):
+        if self.loader is not None:
+            print("Open cancelled")
+            self.loader.cancel()
+            if self.loader.isRunning():
+                loader = self.loader
+                self.loaders.append(loader)
+                loader.finished.connect(lambda: self.loaders.remove(loader), Qt.ConnectionType.QueuedConnection)
+            self.loader = None
+        self.close_progress()
+
+    def on_load_failed(self, message):
+        self.loader = None
+        self.close_progress()
+        QMessageBox.critical(self.root, "Open", message)
+
+    def on_project_loaded(self):
+        loader = self.loader
+        if loader is None:
+            return
+        self.loader = None
+        self.close_progress()
+        self.root.par.qw.clear_view()
+        self.root.par.qw.world.reset_view()
+        if self.new_project_window is None:
+            self.new_project_window = NewSSM(self)
+        self.new_project_window.current_pc_file = loader.pc
+        self.new_project_window.current_mean_file = loader.mean_mesh
+        # optional, only load the leading modes
+        self.new_project_window.current_n_modes = loader.n_modes
+        self.new_project_window.current_variance = loader.variance
+        self.shape_model = loader.shape_model
+        self.geo = loader.mean_mesh
+        self.update_model_connector(loader)
+        self.root.par.ssm_panel.reset_number_pc(self.shape_model.weights.shape[0])
+
+    def stop_loading(self):
+        self.cancel_load()
+        for loader in list(self.loaders):
+            loader.wait()
 
     def save(self):
         try:
             ret = {'pc': self.new_project_window.current_pc_file,
                    'mean_mesh': self.new_project_window.current_mean_file}
+            if self.new_project_window.current_n_modes is not None:
+                ret['n_modes'] = self.new_project_window.current_n_modes
+            if self.new_project_window.current_variance is not None:
+                ret['variance'] = self.new_project_window.current_variance
         except AttributeError:
             print("nothing to save")
             return
@@ -154,15 +246,8 @@ class SSMConfig(CustomConfig):
         if self.current_file is not None and os.path.exists(self.current_file):
             file_paths = JSONSUtl.load_json(self.current_file)
             if os.path.exists(file_paths['pc']) and os.path.exists(file_paths['mean_mesh']):
-                self.root.par.qw.clear_view()
-                self.root.par.qw.world.reset_view()
-                self.new_project_window = NewSSM(self)
-                self.new_project_window.current_pc_file = file_paths['pc']
-                self.new_project_window.current_mean_file = file_paths['mean_mesh']
-                self.shape_model = ShapeModel(file_paths['pc'])
-                self.geo = file_paths['mean_mesh']
-                self.update_model_connector()
-                self.root.par.ssm_panel.reset_number_pc(self.shape_model.weights.shape[0])
+                self.open_project(file_paths['pc'], file_paths['mean_mesh'], file_paths.get('n_modes'),
+                                  file_paths.get('variance'))
             else:
                 if not os.path.exists(file_paths['pc']):
                     print("PC file not found: {0}".format(file_paths['pc']))
@@ -185,24 +270,512 @@ class ModelConnector:
         self.static_mean_actor = None
         self.mean_mesh_poly = None
         self.model_name = None
-
-
-    def update_world(self, onload = False):
+        self.reconstruction = None
+        self.points_buffer = None
+        self.vtk_points = None
+        self.worker: ReconstructionThread = None
+        self.precision = 'float64'
+        self.colour_mode = None
+        self.displacement: DisplacementScalars = None
+        self.scalars_buffer = None
+        self.vtk_scalars = None
+        self.mesh_cache = None  # cached arrays of the mean mesh (see MeshCache)
+        self.normals: VertexNormals = None
+        self.normals_buffer = None
+        self.vtk_normals = None
+        self.colour_range = 1.0
+        self.influence_pc = None
+        self.current_sd = None
+        # level of detail: 'off', 'drag' (proxy during every slider drag) or 'auto' (proxy once a
+        # full resolution frame takes longer than lod_budget msec during a drag)
+        self.lod_mode = 'auto'
+        self.lod_budget = 33.0
+        self.lod_min_points = 20000
+        self.lod_reduction = 0.9
+        self.proxy_actor = None
+        self.proxy_model: ShapeModel = None
+        self.proxy_buffer = None
+        self.proxy_points = None
+        self.proxy_ids = None
+        self.proxy_scalars_buffer = None
+        self.proxy_vtk_scalars = None
+        self.proxy_displacement: DisplacementScalars = None
+        self.proxy_worker: ReconstructionThread = None
+        self.dragging = False
+        self.use_proxy = False
+        self.last_frame = 0.0
+        # PC sweep animation, keyframes are pushed to the live mesh on a fixed timer
+        self.sweep: SweepKeyframes = None
+        self.sweep_frame = 0
+        self.sweep_timer = QTimer()
+        self.sweep_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.sweep_timer.setInterval(16)
+        self.sweep_timer.timeout.connect(self.next_frame)
+
+
+    def update_world(self, onload = False, poly=None, mesh_cache=None, proxy=None, proxy_model=None, engines=None):
+        """
+        Hook the model up to the view, reusing what the ProjectLoader already built
+        """
+        self.stop_sweep(restore=False)
+        self.stop_worker()
+        self.current_sd = None
+        self.influence_pc = None
+        self.dragging = False
+        self.use_proxy = False
         model_path = os.path.split(self.mean_mesh_file)
         self.model_name = model_path[1][: model_path[1].rindex('.')]
-        self.mean_mesh_actor = self.qw.world.add_actor(filename=self.mean_mesh_file)
+        self.mean_mesh_actor = self.qw.world.add_actor(filename=self.mean_mesh_file, polydata=poly)
         self.static_mean_actor = self.qw.world.copy_actor(self.mean_mesh_actor)
         self.static_mean_actor.SetVisibility(False)
         self.qw.world.add_actor(actor_name="static_mean", actor=self.static_mean_actor)
         self.mean_mesh_poly = self.mean_mesh_actor.GetMapper().GetInput()
+        self.bind_points()
+        if self.shape_model.precision != self.precision:
+            self.shape_model.set_precision(self.precision)
+            engines = None      # changed while loading
+        self.load_mesh_cache(mesh_cache)
+        self.bind_scalars()
+        self.bind_normals()
+        self.build_proxy(proxy, proxy_model)
+        self.start_worker(engines=engines)
         self.qw.refresh_model_name(self.model_name)
         self.qw.reset_zoom(onload)
 
-    def update_actor(self, points):
-        p = VTKMeshUtl.extract_points(self.mean_mesh_poly)
-        q = VTKMeshUtl.extract_points(self.static_mean_actor)
-        self.mean_mesh_poly = VTKMeshUtl.update_poly_w_points(points, self.mean_mesh_poly)
-        self.qw.world.update_view()
+    def bind_points(self):
+        """
+        Back the live mesh's vtkPoints with a numpy buffer
+        """
+        current = vtk_to_numpy(self.mean_mesh_poly.GetPoints().GetData())
+        self.points_buffer = np.array(current, copy=True, order='C')
+        self.vtk_points = vtk.vtkPoints()
+        self.vtk_points.SetData(numpy_to_vtk(self.points_buffer, deep=False))
+        self.mean_mesh_poly.SetPoints(self.vtk_points)
+
+    def build_proxy(self, proxy=None, proxy_model=None):
+        """
+        Decimated copy of the mean mesh shown during slider drags, None for small meshes
+        """
+        self.qw.world.remove_actor("lod_proxy")
+        self.proxy_actor = None
+        self.proxy_model = None
+        if self.points_buffer.shape[0] < self.lod_min_points:
+            return
+        if proxy is None:
+            proxy = decimate(self.static_mean_actor.GetMapper().GetInput(), self.lod_reduction)
+        proxy_poly, vertex_ids = proxy
+        self.proxy_model = self.shape_model.subset(vertex_ids) if proxy_model is None else proxy_model
+        self.proxy_buffer = np.reshape(np.array(self.proxy_model.mean64, dtype=float), [-1, 3])
+        self.proxy_points = vtk.vtkPoints()
+        self.proxy_points.SetData(numpy_to_vtk(self.proxy_buffer, deep=False))
+        proxy_poly.SetPoints(self.proxy_points)
+        # the proxy's rows of the live scalars, coloured like the live mesh (see colour_proxy)
+        self.proxy_ids = vertex_ids
+        self.proxy_scalars_buffer = np.zeros(vertex_ids.shape[0], dtype=np.float32)
+        self.proxy_vtk_scalars = numpy_to_vtk(self.proxy_scalars_buffer, deep=False)
+        self.proxy_vtk_scalars.SetName("displacement")
+        proxy_poly.GetPointData().SetScalars(self.proxy_vtk_scalars)
+        normals = self.displacement.normals
+        self.proxy_displacement = DisplacementScalars(self.proxy_buffer.copy(),
+                                                      None if normals is None else normals[vertex_ids],
+                                                      self.displacement.mode)
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(proxy_poly)
+        self.proxy_actor = vtk.vtkActor()
+        self.proxy_actor.SetMapper(mapper)
+        # shared, so colour and opacity changes apply to both
+        self.proxy_actor.SetProperty(self.mean_mesh_actor.GetProperty())
+        self.proxy_actor.SetVisibility(False)
+        self.qw.world.add_actor(actor_name="lod_proxy", actor=self.proxy_actor)
+        self.colour_proxy()
+        print("LOD proxy: {0} of {1} vertices".format(vertex_ids.shape[0], self.points_buffer.shape[0]))
+
+    def colour_proxy(self, field=None):
+        """
+        Colour the LOD proxy like the live mesh
+        :param field: per vertex field shown instead of the displacement (influence map)
+        """
+        if self.proxy_actor is None:
+            return
+        source = self.mean_mesh_actor.GetMapper()
+        mapper = self.proxy_actor.GetMapper()
+        mapper.SetLookupTable(source.GetLookupTable())
+        mapper.SetScalarModeToUsePointData()
+        mapper.UseLookupTableScalarRangeOff()
+        mapper.SetScalarRange(source.GetScalarRange())
+        mapper.SetScalarVisibility(source.GetScalarVisibility())
+        if field is not None:
+            np.copyto(self.proxy_scalars_buffer, np.asarray(field)[self.proxy_ids], casting='same_kind')
+            self.proxy_vtk_scalars.Modified()
+        self.proxy_displacement.mode = self.displacement.mode
+        if self.proxy_worker is not None:
+            self.proxy_worker.set_scalars(self.proxy_displacement if self.live_scalars() else None)
+
+    def begin_drag(self):
+        self.dragging = True
+        self.stop_sweep()
+        if self.lod_mode == 'drag' or (self.lod_mode == 'auto' and self.last_frame > self.lod_budget):
+            self.show_proxy()
+
+    def end_drag(self):
+        """
+        Back to full resolution, the proxy stays visible until the full mesh has been reconstructed
+        """
+        self.dragging = False
+        if self.use_proxy:
+            self.use_proxy = False
+            if self.current_sd is not None:
+                self.submit(self.current_sd)
+
+    def show_proxy(self):
+        if self.proxy_actor is None or self.proxy_worker is None or self.use_proxy:
+            return
+        self.use_proxy = True
+        if self.current_sd is not None:
+            self.proxy_worker.submit(self.current_sd)
+
+    def swap_actors(self, proxy):
+        self.proxy_actor.SetVisibility(proxy)
+        self.mean_mesh_actor.SetVisibility(not proxy)
+
+    def load_mesh_cache(self, mesh=None):
+        """
+        Mean mesh arrays from the mesh cache, None if they do not match the model
+        """
+        self.mesh_cache = None
+        if mesh is None:
+            try:
+                mesh = MeshCache.default().load(self.mean_mesh_file)
+            except OSError as e:
+                print("Unable to use the mesh cache: {0}".format(e))
+                return
+        if mesh['points'].shape[0] == self.points_buffer.shape[0]:
+            self.mesh_cache = mesh
+
+    def bind_scalars(self):
+        """
+        Persistent float32 displacement scalars on the live mesh
+        """
+        self.scalars_buffer = np.zeros(self.points_buffer.shape[0], dtype=np.float32)
+        self.vtk_scalars = numpy_to_vtk(self.scalars_buffer, deep=False)
+        self.vtk_scalars.SetName("displacement")
+        self.mean_mesh_poly.GetPointData().SetScalars(self.vtk_scalars)
+        self.mean_mesh_actor.GetMapper().ScalarVisibilityOff()
+        if self.mesh_cache is not None:
+            mean_normals = self.mesh_cache['normals']
+        else:
+            mean_normals = point_normals(self.static_mean_actor.GetMapper().GetInput())
+        self.displacement = DisplacementScalars(np.reshape(self.shape_model.mean, [-1, 3]), mean_normals)
+        self.colour_range = 3.0 * float(np.max(self.shape_model.vertex_sd()))
+        if self.colour_range <= 0:
+            self.colour_range = 1.0
+        self.set_colour_mode(self.colour_mode)
+
+    def bind_normals(self):
+        """
+        Persistent float32 normals on the live mesh, recomputed with every reconstruction
+        """
+        self.normals_buffer = np.zeros(self.points_buffer.shape, dtype=np.float32)
+        if self.mesh_cache is not None and 'incident' in self.mesh_cache:
+            topology = tuple(self.mesh_cache[n] for n in MeshCache.topology_names)
+            self.normals = VertexNormals(self.mesh_cache['connectivity'].reshape([-1, 3]), self.points_buffer.shape[0],
+                                         topology)
+            np.copyto(self.normals_buffer, self.mesh_cache['normals'])
+        else:
+            faces = poly_to_arrays(self.mean_mesh_poly)[1]
+            self.normals = VertexNormals(faces, self.points_buffer.shape[0])
+            self.normals.compute(self.points_buffer, self.normals_buffer)
+        self.vtk_normals = numpy_to_vtk(self.normals_buffer, deep=False)
+        self.vtk_normals.SetName("Normals")
+        self.mean_mesh_poly.GetPointData().SetNormals(self.vtk_normals)
+
+    def set_colour_mode(self, mode=None):
+        """
+        :param mode: None, 'magnitude' or 'normal'
+        """
+        self.colour_mode = mode
+        if self.mean_mesh_actor is None or self.displacement is None or self.influence_pc is not None:
+            return
+        mapper = self.mean_mesh_actor.GetMapper()
+        if mode is None:
+            mapper.ScalarVisibilityOff()
+            if self.worker is not None:
+                self.worker.set_scalars(None)
+        else:
+            self.displacement.mode = mode
+            lut = vtk.vtkLookupTable()
+            lut.SetHueRange(0.667, 0.0)
+            lut.Build()
+            mapper.SetLookupTable(lut)
+            mapper.SetScalarModeToUsePointData()
+            mapper.UseLookupTableScalarRangeOff()
+            if mode == 'normal':
+                mapper.SetScalarRange(-self.colour_range, self.colour_range)
+            else:
+                mapper.SetScalarRange(0.0, self.colour_range)
+            mapper.ScalarVisibilityOn()
+            if self.worker is not None:
+                self.worker.set_scalars(self.displacement)
+        self.colour_proxy()
+        if mode is not None and self.worker is not None:
+            self.submit(self.current_sd)
+        self.qw.request_render()
+
+    def play_sweep(self, pc, sd_range=2.0, n_frames=120):
+        """
+        Loop PC pc between -sd_range and +sd_range SD
+        """
+        self.stop_sweep(restore=False)
+        if self.shape_model is None or self.mean_mesh_actor is None:
+            return
+        if pc >= self.shape_model.weights.shape[0]:
+            print("No PC {0} in the model".format(pc + 1))
+            return
+        sd = self.current_sd if self.current_sd is not None else np.zeros(self.shape_model.weights.shape[0])
+        scalars = self.displacement if self.live_scalars() else None
+        sweep = SweepKeyframes(self.shape_model, pc, sd, sd_range, n_frames, self.normals, scalars)
+        # bound to this sweep, a queued ready() of a cancelled one must not start the new one early
+        sweep.ready.connect(lambda: self.on_sweep_ready(sweep), Qt.ConnectionType.QueuedConnection)
+        self.sweep = sweep
+        sweep.start()
+
+    def on_sweep_ready(self, sweep):
+        if sweep is not self.sweep:
+            return
+        if self.use_proxy:
+            self.use_proxy = False
+            self.swap_actors(False)
+        if self.worker is not None:
+            self.worker.invalidate()     # the frames are written into its front buffers
+        self.sweep_frame = 0
+        self.sweep_timer.start()
+
+    def next_frame(self):
+        if self.sweep is None:
+            return
+        self.sweep.frame(self.sweep_frame, self.points_buffer, self.normals_buffer, self.scalars_buffer)
+        self.vtk_points.Modified()
+        self.vtk_normals.Modified()
+        if self.live_scalars():
+            self.vtk_scalars.Modified()
+        self.sweep_frame = (self.sweep_frame + 1) % self.sweep.n_frames
+        self.qw.request_render()
+
+    def stop_sweep(self, restore=True):
+        """
+        :param restore: reconstruct the current sd vector again
+        """
+        self.sweep_timer.stop()
+        if self.sweep is None:
+            return
+        self.sweep.cancel()
+        self.sweep = None
+        if restore and self.current_sd is not None:
+            self.submit(self.current_sd)
+
+    def show_influence(self, pc=None):
+        """
+        :param pc: index of the PC, -1 for the per vertex SD, None to go back to the colour mode
+        """
+        self.influence_pc = pc
+        if self.mean_mesh_actor is None or self.shape_model is None:
+            return
+        if pc is None:
+            self.set_colour_mode(self.colour_mode)
+            return
+        if pc < 0:
+            field = self.shape_model.vertex_sd()
+        else:
+            influence = self.shape_model.influence_maps()
+            if pc >= influence.shape[0]:
+                print("No PC {0} in the model".format(pc + 1))
+                return
+            field = influence[pc]
+        if self.worker is not None:
+            self.worker.set_scalars(None)
+        np.copyto(self.scalars_buffer, field, casting='same_kind')
+        self.vtk_scalars.Modified()
+        lut = vtk.vtkLookupTable()
+        lut.SetHueRange(0.667, 0.0)
+        lut.Build()
+        mapper = self.mean_mesh_actor.GetMapper()
+        mapper.SetLookupTable(lut)
+        mapper.SetScalarModeToUsePointData()
+        mapper.UseLookupTableScalarRangeOff()
+        top = float(np.max(field))
+        mapper.SetScalarRange(0.0, top if top > 0 else 1.0)
+        mapper.ScalarVisibilityOn()
+        self.colour_proxy(field)
+        self.qw.request_render()
+
+    def live_scalars(self):
+        return self.colour_mode is not None and self.influence_pc is None
+
+    def start_worker(self, sd=None, engines=None):
+        """
+        Start the reconstruction threads, the meshes are rendered from their front buffers
+        """
+        self.stop_worker()
+        engine, proxy_engine = (None, None) if engines is None else engines
+        self.reconstruction = self.shape_model.incremental() if engine is None else engine
+        self.worker = ReconstructionThread(self.reconstruction)
+        front = ModelConnector.take_over(self.worker, {'points': self.points_buffer, 'scalars': self.scalars_buffer,
+                                                       'normals': self.normals_buffer})
+        self.points_buffer = front['points']
+        self.vtk_points.SetData(numpy_to_vtk(self.points_buffer, deep=False))
+        self.scalars_buffer = front['scalars']
+        self.vtk_scalars = numpy_to_vtk(self.scalars_buffer, deep=False)
+        self.vtk_scalars.SetName("displacement")
+        self.mean_mesh_poly.GetPointData().SetScalars(self.vtk_scalars)
+        self.normals_buffer = front['normals']
+        self.vtk_normals = numpy_to_vtk(self.normals_buffer, deep=False)
+        self.vtk_normals.SetName("Normals")
+        self.mean_mesh_poly.GetPointData().SetNormals(self.vtk_normals)
+        if self.live_scalars():
+            self.worker.set_scalars(self.displacement)
+        self.worker.set_normals(self.normals)
+        self.worker.reconstructed.connect(self.on_reconstructed, Qt.ConnectionType.QueuedConnection)
+        self.worker.start()
+        if self.proxy_model is not None:
+            if proxy_engine is None or self.proxy_model.precision != self.precision:
+                self.proxy_model.set_precision(self.precision)
+                proxy_engine = self.proxy_model.incremental()
+            self.proxy_worker = ReconstructionThread(proxy_engine)
+            front = ModelConnector.take_over(self.proxy_worker, {'points': self.proxy_buffer,
+                                                                 'scalars': self.proxy_scalars_buffer})
+            self.proxy_buffer = front['points']
+            self.proxy_points.SetData(numpy_to_vtk(self.proxy_buffer, deep=False))
+            self.proxy_scalars_buffer = front['scalars']
+            self.proxy_vtk_scalars = numpy_to_vtk(self.proxy_scalars_buffer, deep=False)
+            self.proxy_vtk_scalars.SetName("displacement")
+            self.proxy_actor.GetMapper().GetInput().GetPointData().SetScalars(self.proxy_vtk_scalars)
+            if self.live_scalars():
+                self.proxy_worker.set_scalars(self.proxy_displacement)
+            self.proxy_worker.reconstructed.connect(self.on_proxy_reconstructed, Qt.ConnectionType.QueuedConnection)
+            self.proxy_worker.start()
+        if sd is not None:
+            self.submit(sd)
+
+    @staticmethod
+    def take_over(worker, buffers):
+        """
+        Copy what is shown into the front buffers of a new worker
+        :return: dict of the worker's front buffers
+        """
+        front = worker.front()
+        for name in buffers:
+            np.copyto(front[name], buffers[name], casting='same_kind')
+        worker.invalidate()     # no longer the engine's own reconstruction
+        return front
+
+    def set_precision(self, precision):
+        """
+        :return: maximum vertex deviation between float32 and float64
+        """
+        self.precision = precision
+        if self.shape_model is None:
+            return None
+        self.shape_model.set_precision(precision)
+        self.start_worker(self.current_sd)
+        if self.shape_model.precision_deviation is None:
+            self.shape_model.precision_check()
+        print("float32/float64 max vertex deviation: {0}".format(self.shape_model.precision_deviation))
+        return self.shape_model.precision_deviation
+
+    def export_poly(self, sd):
+        """
+        The live mesh with vertices reconstructed in float64, for export
+        """
+        poly = self.qw.world.actors[self.model_name].GetMapper().GetInput()
+        points = self.shape_model.reconstruct_diff_all(sd, True, precision='float64')
+        export = vtk.vtkPolyData()
+        export.ShallowCopy(poly)
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_to_vtk(np.ascontiguousarray(points), deep=True))
+        export.SetPoints(vtk_points)
+        return export
+
+    def stop_worker(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        if self.proxy_worker is not None:
+            self.proxy_worker.stop()
+            self.proxy_worker = None
+
+    def submit(self, sd):
+        """
+        Queue a sd vector for reconstruction on the worker thread, replacing any pending one
+        """
+        if sd is None:
+            sd = np.zeros(self.shape_model.weights.shape[0])
+        self.current_sd = np.array(sd, dtype=float)
+        if self.sweep is not None:
+            self.stop_sweep(restore=False)
+        if self.use_proxy and self.proxy_worker is not None:
+            self.proxy_worker.submit(self.current_sd)
+        elif self.worker is not None:
+            self.worker.submit(self.current_sd)
+
+    def on_reconstructed(self):
+        self.qw.schedule('upload', self.upload)
+
+    def on_proxy_reconstructed(self):
+        self.qw.schedule('upload_proxy', self.upload_proxy)
+
+    def upload(self):
+        if self.sweep is not None:
+            return
+        buffers = self.worker.take() if self.worker is not None else None
+        if buffers:
+            self.swap_buffers(buffers)
+            if self.proxy_actor is not None:
+                if self.use_proxy:
+                    return
+                self.swap_actors(False)
+            # time of the previous full resolution frame, reconstruction plus render
+            render_time = max(self.qw.world.ren.GetLastRenderTimeInSeconds(), 0.0)    # -1 before the first render
+            self.last_frame = self.worker.elapsed + 1000.0 * render_time
+            if self.dragging and self.lod_mode == 'auto' and self.last_frame > self.lod_budget:
+                self.show_proxy()
+            self.qw.request_render()
+
+    def upload_proxy(self):
+        buffers = self.proxy_worker.take() if self.proxy_worker is not None else None
+        if buffers:
+            self.swap_proxy_buffers(buffers)
+            if not self.use_proxy:
+                return
+            self.swap_actors(True)
+            self.qw.request_render()
+
+    def swap_buffers(self, buffers):
+        """
+        Render the live mesh from the buffers the worker has just filled
+        """
+        if 'points' in buffers:
+            self.points_buffer = buffers['points']
+            set_vtk_buffer(self.vtk_points.GetData(), self.points_buffer)
+            self.vtk_points.Modified()
+        if 'scalars' in buffers:
+            self.scalars_buffer = buffers['scalars']
+            set_vtk_buffer(self.vtk_scalars, self.scalars_buffer)
+            self.vtk_scalars.Modified()
+        if 'normals' in buffers:
+            self.normals_buffer = buffers['normals']
+            set_vtk_buffer(self.vtk_normals, self.normals_buffer)
+            self.vtk_normals.Modified()
+
+    def swap_proxy_buffers(self, buffers):
+        if 'points' in buffers:
+            self.proxy_buffer = buffers['points']
+            set_vtk_buffer(self.proxy_points.GetData(), self.proxy_buffer)
+            self.proxy_points.Modified()
+        if 'scalars' in buffers:
+            self.proxy_scalars_buffer = buffers['scalars']
+            set_vtk_buffer(self.proxy_vtk_scalars, self.proxy_scalars_buffer)
+            self.proxy_vtk_scalars.Modified()
+
 
 class MainMenuBar(QMenuBar):
     debug = False
@@ -315,6 +888,12 @@ class MainMenuBar(QMenuBar):
 
 class O3dHelperApp(QMainWindow):
     def closeEvent(self, event):
+        self.main_widget.menu_bar.config_me.stop_loading()
+        self.stop_mesh_loaders()
+        for loader in list(self.mesh_loaders):
+            loader.wait()
+        self.model_connector.stop_sweep(restore=False)
+        self.model_connector.stop_worker()
         self.qw.on_close()
         try:
             self.main_widget.menu_bar.config_me.new_project_window.close()
@@ -339,11 +918,18 @@ class O3dHelperApp(QMainWindow):
         self.setWindowIcon(QIcon(resource_path('icons/vector-alt.png')))
         self.setGeometry(self.left, self.top, self.width, self.height)
 
+        self.mesh_loaders = []     # running, including cancelled ones still finishing in the background
+        self.mesh_queue = []
+        self.cache_dropped = False      # read dropped meshes through the on-disk MeshCache, see Preference
+
         self.main_widget = MainWidget(self)
         self.main_widget.no_3d = [self.width, self.height]
         self.main_widget.with_3d = [int(np.round(0.8 * size.width(), 0)), self.height]
         self.qw = WorldView(self.main_widget, self)
         self.model_connector = ModelConnector(self.qw)
+        # a MeshInfoWidget row (visibility, colour, remove) for each dropped mesh
+        self.mesh_menu = WorldMenuWidget(self, self.qw)
+        self.mesh_menu.set_remove_action(self.remove_dropped)
         self.main_widget.menu_bar.set_model_connector(self.model_connector)
         self.ssm_panel = SSMInfoWidget(self, self.model_connector)
         self.camera_widget = CameraWidget(self, self.qw)
@@ -423,25 +1009,135 @@ class O3dHelperApp(QMainWindow):
 
     def dropEvent(self, e):
         """
-        Drop File locations, stored in files
+        Drop File locations, a .ssm project is opened and meshes are added to the view
         :param e:
         :return:
         """
         if e.mimeData().hasUrls:
             e.setDropAction(Qt.DropAction.CopyAction)
             e.accept()
-            files = []
-            count = 0
-            self.qw.clear_view()
+            projects = []
+            meshes = []
             for url in e.mimeData().urls():
                 filename = str(url.toLocalFile())
-                if filename.endswith(".ssm"):
-                    config = self.main_widget.get_config()
-                    config.load(filename)
-                files.append(filename)
-                count += 1
-                print(filename)
-                break
+                ext = os.path.splitext(filename)[1].lower()
+                if ext == ".ssm":
+                    projects.append(filename)
+                elif ext in MeshLoader.extensions:
+                    meshes.append(filename)
+                else:
+                    print("Unsupported file dropped: {0}".format(filename))
+            if not projects and not meshes:
+                return
+            # added to the meshes of the previous drops, see remove_dropped
+            if projects:
+                if len(projects) > 1:
+                    print("Only one project can be open, opening {0}".format(projects[0]))
+                config = self.main_widget.get_config()
+                config.load(projects[0])
+                if config.loader is not None:
+                    # opening the project clears the view, the dropped meshes are added back after it
+                    config.loader.loaded.connect(self.restore_dropped, Qt.ConnectionType.QueuedConnection)
+            if meshes:
+                self.load_meshes(meshes)
+
+    def load_meshes(self, filenames):
+        """
+        Read the meshes on a pool of worker threads, each one is added to the world once read
+        """
+        print("Loading {0} meshes".format(len(filenames)))
+        loader = MeshLoader(filenames, use_cache=self.cache_dropped)
+        loader.mesh_loaded.connect(lambda f, poly: self.on_mesh_loaded(loader, f, poly),
+                                   Qt.ConnectionType.QueuedConnection)
+        loader.failed.connect(lambda f, message: print("Unable to load {0}: {1}".format(f, message)),
+                              Qt.ConnectionType.QueuedConnection)
+        loader.finished.connect(lambda: self.on_meshes_loaded(loader), Qt.ConnectionType.QueuedConnection)
+        self.mesh_loaders.append(loader)
+        loader.start()
+
+    def on_mesh_loaded(self, loader, filename, poly):
+        if loader.cancelled:
+            return
+        rng = np.random.default_rng()
+        c = rng.uniform(0.5, 1.0, 3)
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(poly)
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        actor.GetProperty().SetColor(c[0], c[1], c[2])
+        name = os.path.basename(filename)
+        self.mesh_queue.append((filename, name[:name.rindex(".")], actor))
+        # meshes read within the same frame are added together, with a single render
+        self.qw.schedule('dropped_meshes', self.add_queued)
+
+    def on_meshes_loaded(self, loader):
+        """
+        All meshes of the drop are read, the camera is reset once they have been added
+        """
+        self.mesh_loaders.remove(loader)
+        if loader.cancelled:
+            return
+        # scheduled after 'dropped_meshes', so it runs after the last meshes of the drop are added
+        self.qw.schedule('dropped_camera', self.qw.world.ren.ResetCamera)
+
+    def add_queued(self):
+        queue = self.mesh_queue
+        self.mesh_queue = []
+        rows = []
+        for filename, name, actor in queue:
+            rows.append((filename, self.add_dropped(name, actor), actor))
+        self.mesh_menu.updated_meshes(rows, append=True)
+
+    def add_dropped(self, name, actor):
+        """
+        :return: the name of the actor in the world, name made unique
+        """
+        world = self.qw.world
+        taken = set(world.actors) | set(row.actor_name for row in self.mesh_menu.mesh_list)
+        unique = name
+        i = 2
+        while unique in taken:
+            unique = "{0} ({1})".format(name, i)
+            i += 1
+        world.actors[unique] = actor
+        world.ren.AddActor(actor)
+        return unique
+
+    def restore_dropped(self):
+        world = self.qw.world
+        for row in self.mesh_menu.mesh_list:
+            if row.actor is not None:
+                world.actors[row.actor_name] = row.actor
+                world.ren.AddActor(row.actor)
+        self.qw.request_render()
+
+    def remove_dropped(self):
+        self.stop_mesh_loaders()
+        world = self.qw.world
+        for row in self.mesh_menu.mesh_list:
+            if row.actor is None:
+                continue
+            if world.actors.get(row.actor_name) is row.actor:
+                world.actors.pop(row.actor_name)
+            world.ren.RemoveActor(row.actor)
+        self.mesh_menu.updated_meshes([])
+        self.mesh_queue = []
+        self.qw.request_render()
+
+    def show_mesh_menu(self, button):
+        if not self.mesh_menu.mesh_list:
+            print("No dropped meshes")
+            return
+        p = button.mapToGlobal(button.rect().topRight())
+        self.mesh_menu.move(p.x() + 5, p.y())
+        self.mesh_menu.show()
+
+    def stop_mesh_loaders(self):
+        """
+        Cancel the drops still loading, meshes being read finish in the background and are discarded
+        """
+        for loader in self.mesh_loaders:
+            loader.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+
+
+class SweepKeyframes(QThread):
+    """
+    Background build of the keyframes sweeping one PC between -sd_range and +sd_range
+    """
+    ready = Signal()
+
+    def __init__(self, shape_model, pc, sd, sd_range=2.0, n_frames=120, normals=None, scalars=None,
+                 memory_budget=512 * 2 ** 20, chunk_size=16):
+        """
+        :param sd: current sd vector, the other PCs stay at these values
+        :param normals: optional VertexNormals, computed for every keyframe
+        :param scalars: optional DisplacementScalars, computed for every keyframe
+        """
+        super().__init__()
+        self.shape_model = shape_model
+        self.normals = None if normals is None else normals.copy()
+        self.scalars = None if scalars is None else scalars.copy()
+        self.chunk_size = chunk_size
+        self.cancelled = False
+        n = int(shape_model.mean.shape[0] / 3)
+        frame_bytes = 4 * n * (3 + (3 if normals is not None else 0) + (1 if scalars is not None else 0))
+        n_frames = int(max(8, min(n_frames, memory_budget // frame_bytes)))
+        self.sds = np.zeros([n_frames, shape_model.weights.shape[0]])
+        self.sds[:] = np.asarray(sd, dtype=float)[:shape_model.weights.shape[0]]
+        # sine, so the sweep slows down at the extremes and loops without a jump
+        self.sds[:, pc] = sd_range * np.sin(2 * np.pi * np.arange(n_frames) / n_frames)
+        self.points = np.empty([n_frames, n, 3], dtype=np.float32)
+        self.frame_normals = None
+        if normals is not None:
+            self.frame_normals = np.empty([n_frames, n, 3], dtype=np.float32)
+        self.frame_scalars = None
+        if scalars is not None:
+            self.frame_scalars = np.empty([n_frames, n], dtype=np.float32)
+
+    @property
+    def n_frames(self):
+        return self.points.shape[0]
+
+    def run(self):
+        for i in range(0, self.n_frames, self.chunk_size):
+            if self.cancelled:
+                return
+            block = self.shape_model.reconstruct_batch(self.sds[i: i + self.chunk_size])
+            np.copyto(self.points[i: i + self.chunk_size], block, casting='same_kind')
+            for j in range(block.shape[0]):
+                if self.normals is not None:
+                    self.normals.compute(block[j], self.frame_normals[i + j])
+                if self.scalars is not None:
+                    self.scalars.compute(block[j], self.frame_scalars[i + j])
+        if not self.cancelled:
+            self.ready.emit()
+
+    def cancel(self):
+        self.cancelled = True
+        self.wait()
+
+    def frame(self, i, points, normals=None, scalars=None):
+        """
+        Copy keyframe i into the live buffers
+        """
+        np.copyto(points, self.points[i], casting='same_kind')
+        if normals is not None and self.frame_normals is not None:
+            np.copyto(normals, self.frame_normals[i])
+        if scalars is not None and self.frame_scalars is not None:
+            np.copyto(scalars, self.frame_scalars[i])
@@ -1,7 +1,7 @@
 import os
 
 from PySide6.QtWidgets import (QLabel, QVBoxLayout, QHBoxLayout, QWidget, QLineEdit, QPushButton, QColorDialog,
-                               QCheckBox, QComboBox)
+                               QCheckBox, QComboBox, QMessageBox)
 from PySide6.QtGui import QIcon, QPixmap, QPainter, QFontMetrics, QColor, QBrush, QPen
 from PySide6.QtCore import Qt, QRect
 
@@ -41,6 +41,7 @@ class CustomCheckbox(QCheckBox):
         painter.drawText(text_rect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, self.text())
 
 class Preference(QWidget):
+    colour_modes = {'Solid': None, 'Displacement': 'magnitude', 'Normal displacement': 'normal'}
 
     def update_connections(self):
         self.view = self.root.qw
@@ -62,24 +63,27 @@ class Preference(QWidget):
         self.opacity_mean.set_initial_value(1)
         self.opacity_current.set_initial_value(1)
         self.pc_sd_text_box.setCurrentIndex(1)
+        self.precision_box.setCurrentIndex(0)
+        self.colour_mode_box.setCurrentIndex(0)
         self.show_mesh.setChecked(False)
 
-        try:
-            actor = self.view.world.actors["static_mean"]
-            actor.GetProperty().SetColor(242 / 255.0, 238 / 255.0, 220 / 255.0)
-            self.view.world.update_view()
-        except KeyError:
-            pass
-
-        try:
-            actor = self.view.world.actors[self.ssm.model.model_name]
-            actor.GetProperty().SetColor(242 / 255.0, 238 / 255.0, 220 / 255.0)
-
-            self.view.world.update_view()
-        except KeyError:
-            pass
+        self.schedule_actor("static_mean", 'colour',
+                            lambda a: a.GetProperty().SetColor(242 / 255.0, 238 / 255.0, 220 / 255.0))
+        self.schedule_actor(self.ssm.model.model_name, 'colour',
+                            lambda a: a.GetProperty().SetColor(242 / 255.0, 238 / 255.0, 220 / 255.0))
         self.update()
 
+    def schedule_actor(self, actor_name, key, func):
+        """
+        Apply func(actor) on the next frame, only the latest update per actor and key is applied
+        """
+        def apply():
+            try:
+                func(self.view.world.actors[actor_name])
+            except KeyError:
+                pass
+        self.view.schedule((key, actor_name), apply)
+
     @staticmethod
     def button_background(color):
         def rgb_to_hex(r, g, b):
@@ -188,6 +192,46 @@ class Preference(QWidget):
         hv.addStretch(5)
         line5.setLayout(hv)
 
+        line7 = QWidget()
+        hv = QHBoxLayout()
+        self.precision_label = QLabel("Precision:")
+        self.precision_box = QComboBox()
+        for p in ShapeModel.precisions:
+            self.precision_box.addItem(p)
+        self.precision_box.setCurrentIndex(0)
+        self.precision_box.currentIndexChanged.connect(self.precision_changed)
+        self.precision_deviation = QLabel("")
+        hv.addWidget(self.precision_label)
+        hv.addSpacing(5)
+        hv.addWidget(self.precision_box)
+        hv.addSpacing(5)
+        hv.addWidget(self.precision_deviation)
+        hv.addStretch(5)
+        line7.setLayout(hv)
+
+        line8 = QWidget()
+        hv = QHBoxLayout()
+        self.colour_mode_label = QLabel("Colour by:")
+        self.colour_mode_box = QComboBox()
+        for name in Preference.colour_modes:
+            self.colour_mode_box.addItem(name)
+        self.colour_mode_box.setCurrentIndex(0)
+        self.colour_mode_box.currentIndexChanged.connect(self.colour_mode_changed)
+        hv.addWidget(self.colour_mode_label)
+        hv.addSpacing(5)
+        hv.addWidget(self.colour_mode_box)
+        hv.addStretch(5)
+        line8.setLayout(hv)
+
+        line9 = QWidget()
+        hv = QHBoxLayout()
+        self.cache_dropped = CustomCheckbox("Cache dropped meshes", self)
+        self.cache_dropped.setChecked(self.root.cache_dropped)
+        self.cache_dropped.stateChanged.connect(self.cache_dropped_changed)
+        hv.addWidget(self.cache_dropped)
+        hv.addStretch(5)
+        line9.setLayout(hv)
+
         line6 = QWidget()
         hv = QHBoxLayout()
         self.reset_button = QPushButton('Reset', self)
@@ -203,6 +247,9 @@ class Preference(QWidget):
         layout.addWidget(line3)
         layout.addWidget(self.pc_setting)
         layout.addWidget(line5)
+        layout.addWidget(line7)
+        layout.addWidget(line8)
+        layout.addWidget(line9)
         layout.addStretch(5)
         layout.addWidget(line6)
         self.setLayout(layout)
@@ -213,14 +260,23 @@ class Preference(QWidget):
         self.root.ssm_panel.update_pc_sd_range(sd)
         pass
 
+    def precision_changed(self):
+        deviation = self.root.model_connector.set_precision(self.precision_box.currentText())
+        if deviation is None:
+            self.precision_deviation.setText("")
+        else:
+            self.precision_deviation.setText("max deviation: {0:.2e}".format(deviation))
+
+    def colour_mode_changed(self):
+        mode = Preference.colour_modes[self.colour_mode_box.currentText()]
+        self.root.model_connector.set_colour_mode(mode)
+
+    def cache_dropped_changed(self):
+        self.root.cache_dropped = self.cache_dropped.isChecked()
+
     def on_checkbox_state_changed(self):
-        try:
-            b = self.show_mesh.isChecked()
-            actor = self.view.world.actors["static_mean"]
-            actor.SetVisibility(b)
-            self.view.world.update_view()
-        except KeyError:
-            pass
+        b = self.show_mesh.isChecked()
+        self.schedule_actor("static_mean", 'visibility', lambda a: a.SetVisibility(b))
 
     def choose_color(self):
         cl = QColorDialog()
@@ -231,31 +287,17 @@ class Preference(QWidget):
             g = colour[1]
             b = colour[2]
             self.mean_color=[r, g, b]
-            try:
-                actor = self.view.world.actors["static_mean"]
-                actor.GetProperty().SetColor(r / 255.0, g / 255.0, b / 255.0)
-                self.view.world.update_view()
-            except KeyError:
-                pass
+            self.schedule_actor("static_mean", 'colour',
+                                lambda a: a.GetProperty().SetColor(r / 255.0, g / 255.0, b / 255.0))
             self.color_button.setStyleSheet(Preference.button_background(self.mean_color))
             self.color_indicater_mean.setPixmap(self.draw_rounded_square(self.mean_color))
 
 
     def update_current_mesh_opacity(self, i):
-        try:
-            actor = self.view.world.actors[self.ssm.model.model_name]
-            actor.GetProperty().SetOpacity(i)
-            self.view.world.update_view()
-        except KeyError:
-            pass
+        self.schedule_actor(self.ssm.model.model_name, 'opacity', lambda a: a.GetProperty().SetOpacity(i))
 
     def update_mean_mesh_opacity(self, i):
-        try:
-            actor = self.view.world.actors["static_mean"]
-            actor.GetProperty().SetOpacity(i)
-            self.view.world.update_view()
-        except KeyError:
-            pass
+        self.schedule_actor("static_mean", 'opacity', lambda a: a.GetProperty().SetOpacity(i))
 
     def choose_color_current(self):
         cl = QColorDialog()
@@ -266,13 +308,8 @@ class Preference(QWidget):
             g = colour[1]
             b = colour[2]
             self.current_colour=[r, g, b]
-            try:
-                actor = self.view.world.actors[self.ssm.model.model_name]
-                actor.GetProperty().SetColor(r / 255.0, g / 255.0, b / 255.0)
-
-                self.view.world.update_view()
-            except KeyError:
-                pass
+            self.schedule_actor(self.ssm.model.model_name, 'colour',
+                                lambda a: a.GetProperty().SetColor(r / 255.0, g / 255.0, b / 255.0))
             self.color_button_current.setStyleSheet(Preference.button_background(self.current_colour))
             self.color_indicater_current.setPixmap(self.draw_rounded_square(self.current_colour))
 
@@ -323,7 +360,7 @@ class NewSSM(QWidget):
 
         self.pc_widget = QWidget()
         pc_lay = QHBoxLayout()
-        self.pc_file = QLabel("PC File (*.npz or *.pc): ")
+        self.pc_file = QLabel("PC File (*.npz, *.pc or *.ssmb): ")
         self.pc_path = QLineEdit("PC File Path")
         self.pc_path.setObjectName('text_box')
         self.pc_button = QPushButton('', self)
@@ -351,6 +388,16 @@ class NewSSM(QWidget):
         mesh_layout.addWidget(self.mean_mesh_button)
         self.mesh.setLayout(mesh_layout)
 
+        self.modes_widget = QWidget()
+        modes_layout = QHBoxLayout()
+        self.modes_label = QLabel("Modes (number or variance fraction): ")
+        self.modes = QLineEdit("")
+        self.modes.setPlaceholderText("all")
+        self.modes.setObjectName('text_box')
+        modes_layout.addWidget(self.modes_label)
+        modes_layout.addWidget(self.modes)
+        self.modes_widget.setLayout(modes_layout)
+
         self.control = QWidget()
         con_hor = QHBoxLayout()
         con_hor.addStretch(5)
@@ -364,22 +411,50 @@ class NewSSM(QWidget):
 
         layout.addWidget(self.pc_widget)
         layout.addWidget(self.mesh)
+        layout.addWidget(self.modes_widget)
         layout.addStretch(5)
         layout.addWidget(self.control)
         self.setLayout(layout)
         self.current_pc_file = None
         self.current_mean_file = None
+        self.current_n_modes = None
+        self.current_variance = None
 
     def reset_form(self):
         self.mean_mesh.setText("Mean Mesh Path")
         self.pc_path.setText("PC File Path")
+        self.modes.setText("")
+
+    def read_modes(self):
+        """
+        Empty for all modes, an integer for a fixed number or a fraction of the variance
+        :return: False if the modes box holds neither
+        """
+        self.current_n_modes = None
+        self.current_variance = None
+        txt = self.modes.text().strip()
+        if len(txt) == 0:
+            return True
+        try:
+            v = float(txt)
+        except ValueError:
+            v = None
+        if v is not None and 0 < v < 1:
+            self.current_variance = v
+        elif v is not None and v >= 1 and v.is_integer():
+            self.current_n_modes = int(v)
+        else:
+            QMessageBox.warning(self, "Modes", "Modes must be a number of modes (1, 2, ...) or a fraction of the "
+                                               "variance between 0 and 1, not \"{0}\"".format(txt))
+            return False
+        return True
 
     def on_cancel_click(self):
         self.close()
 
     def open_file_pc(self):
         op = OpenFiles()
-        self.current_pc_file = op.get_file(file_filter=("PC File (*.npz *.pc);;All Files (*.*)"))
+        self.current_pc_file = op.get_file(file_filter=("PC File (*.npz *.pc *.ssmb);;All Files (*.*)"))
         if self.current_pc_file is not None:
             self.pc_path.setText(self.current_pc_file)
         else:
@@ -400,11 +475,11 @@ class NewSSM(QWidget):
         if self.current_pc_file is not None and self.current_mean_file is not None:
             if os.path.exists(self.current_pc_file) and os.path.exists(self.current_mean_file):
                 if self.root is not None:
-                    self.root.root.par.qw.clear_view()
-                    self.root.shape_model = ShapeModel(self.current_pc_file)
-                    self.root.geo = self.current_mean_file
-                    self.root.update_model_connector()
-                    self.root.root.par.ssm_panel.reset_number_pc(self.root.shape_model.weights.shape[0])
+                    if not self.read_modes():
+                        return
+                    self.root.new_project_window = self
+                    self.root.open_project(self.current_pc_file, self.current_mean_file, self.current_n_modes,
+                                           self.current_variance)
 
 
 
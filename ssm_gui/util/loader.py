@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PySide6.QtCore import QThread, Signal
+
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.models.cache import MeshCache, cached_poly
+from ssm_gui.models.mesh import read_poly, decimate
+
+
+class ProjectLoader(QThread):
+    """
+    Load the shape model and the mean mesh of a project concurrently, off the GUI thread
+    """
+    progress = Signal(int, str)
+    loaded = Signal()
+    failed = Signal(str)
+
+    total_steps = 6
+
+    def __init__(self, pc, mean_mesh, n_modes=None, variance=None, lod_min_points=20000, lod_reduction=0.9,
+                 precision='float64'):
+        super().__init__()
+        self.pc = pc
+        self.mean_mesh = mean_mesh
+        self.n_modes = n_modes
+        self.variance = variance
+        self.lod_min_points = lod_min_points
+        self.lod_reduction = lod_reduction
+        self.precision = precision
+        self.cancelled = False
+        self.steps = 0
+        self.shape_model: ShapeModel = None
+        self.poly = None
+        self.mesh_cache = None
+        self.proxy = None
+        self.proxy_model: ShapeModel = None
+        self.engines = None     # IncrementalReconstruction of the model and of the proxy model
+
+    def step(self, message):
+        self.steps += 1
+        if not self.cancelled:
+            self.progress.emit(int(100 * self.steps / ProjectLoader.total_steps), message)
+
+    def load_model(self):
+        shape_model = ShapeModel(self.pc, precision=self.precision, n_modes=self.n_modes, variance=self.variance)
+        self.step("Loaded {0} modes".format(shape_model.weights.shape[0]))
+        if self.cancelled:
+            return shape_model
+        shape_model.vertex_sd()     # influence maps for the colour overlays, cached with the model
+        self.step("Computed the per vertex SD")
+        if self.cancelled:
+            return shape_model
+        shape_model.precision_check()
+        self.step("Checked the float32 precision")
+        return shape_model
+
+    def load_mesh(self):
+        try:
+            self.mesh_cache = MeshCache.default().load(self.mean_mesh)
+            poly = MeshCache.wrap(self.mesh_cache)
+        except OSError as e:
+            print("Unable to use the mesh cache: {0}".format(e))
+            poly = read_poly(self.mean_mesh)
+        self.step("Read the mean mesh ({0} vertices)".format(poly.GetNumberOfPoints()))
+        if not self.cancelled and poly.GetNumberOfPoints() >= self.lod_min_points:
+            self.proxy = decimate(poly, self.lod_reduction)
+        self.step("Built the level of detail proxy")
+        return poly
+
+    def run(self):
+        self.progress.emit(0, "Opening {0}".format(self.pc))
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                model = pool.submit(self.load_model)
+                mesh = pool.submit(self.load_mesh)
+                for f in as_completed([model, mesh]):
+                    f.result()
+            self.shape_model = model.result()
+            self.poly = mesh.result()
+            if not self.cancelled:
+                self.prepare()
+        except Exception as e:     # any failure is reported to the UI, the dialog must not wait forever
+            if not self.cancelled:
+                self.failed.emit("Unable to open the project: {0}".format(e))
+            return
+        if not self.cancelled:
+            self.loaded.emit()
+
+    def prepare(self):
+        """
+        Proxy model and reconstruction engines, each engine starts with a full reconstruction
+        """
+        proxy_engine = None
+        if self.proxy is not None:
+            self.proxy_model = self.shape_model.subset(self.proxy[1])
+            proxy_engine = self.proxy_model.incremental()
+        self.engines = (self.shape_model.incremental(), proxy_engine)
+        self.step("Prepared the reconstruction")
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class MeshLoader(QThread):
+    """
+    Read meshes on a pool of worker threads, mesh_loaded() is emitted as each one is parsed
+    """
+    mesh_loaded = Signal(str, object)
+    failed = Signal(str, str)
+    extensions = ['.ply', '.stl', '.obj', '.vtp', '.vtk']
+
+    def __init__(self, filenames, max_workers=None, use_cache=False):
+        """
+        :param use_cache: read through the shared MeshCache
+        """
+        super().__init__()
+        self.filenames = list(filenames)
+        if max_workers is None:
+            max_workers = min(8, os.cpu_count() or 4)
+        self.max_workers = max(1, min(max_workers, len(self.filenames)))
+        self.use_cache = use_cache
+        self.cancelled = False
+
+    def run(self):
+        if not self.filenames:
+            return
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            read = cached_poly if self.use_cache else read_poly
+            futures = {pool.submit(read, f): f for f in self.filenames}
+            for f in as_completed(futures):
+                if self.cancelled:
+                    break
+                try:
+                    poly = f.result()
+                except Exception as e:     # a bad file must not stop the others
+                    self.failed.emit(futures[f], str(e))
+                    continue
+                if poly is None or poly.GetNumberOfPoints() == 0:
+                    self.failed.emit(futures[f], "no vertices read")
+                    continue
+                self.mesh_loaded.emit(futures[f], poly)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def cancel(self):
+        self.cancelled = True
@@ -0,0 +1,147 @@
+import json
+import os
+
+import numpy as np
+import vtk
+from vtkmodules.util.numpy_support import numpy_to_vtk
+
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.models.mesh import read_mesh, arrays_to_poly, VertexNormals
+
+
+class OffscreenRenderer:
+    """
+    Render shape model instances to PNG without a display, reusing one render pipeline
+    """
+    views = {'+x': ('x', 1), '-x': ('x', -1), '+y': ('y', 1), '-y': ('y', -1), '+z': ('z', 1), '-z': ('z', -1)}
+
+    def __init__(self, width=1024, height=768, scale=1, colour=(242 / 255.0, 238 / 255.0, 220 / 255.0),
+                 background=(0.25, 0.25, 0.25)):
+        self.ren = vtk.vtkRenderer()
+        self.ren.SetBackground(*background)
+        self.window = vtk.vtkRenderWindow()
+        self.window.SetOffScreenRendering(1)
+        self.window.SetSize(width, height)
+        self.window.AddRenderer(self.ren)
+        self.mapper = vtk.vtkPolyDataMapper()
+        self.mapper.ScalarVisibilityOff()
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(self.mapper)
+        self.actor.GetProperty().SetColor(*colour)
+        self.ren.AddActor(self.actor)
+        self.image = vtk.vtkWindowToImageFilter()
+        self.image.SetInput(self.window)
+        self.image.SetInputBufferTypeToRGB()
+        self.image.ReadFrontBufferOff()
+        self.image.SetScale(scale, scale)
+        self.writer = vtk.vtkPNGWriter()
+        self.writer.SetInputConnection(self.image.GetOutputPort())
+        self.shape_model = None
+        self.points = None
+        self.normals = None
+        self.normals_buffer = None
+        self.poly = None
+        self.home = None
+
+    @staticmethod
+    def load_project(ssm_file, precision='float32'):
+        """
+        :return: ShapeModel and mean mesh faces of a .ssm project
+        """
+        with open(ssm_file) as f:
+            file_paths = json.load(f)
+        shape_model = ShapeModel(file_paths['pc'], precision=precision, n_modes=file_paths.get('n_modes'),
+                                 variance=file_paths.get('variance'))
+        points, faces = read_mesh(file_paths['mean_mesh'])
+        return shape_model, faces
+
+    def set_model(self, shape_model: ShapeModel, faces):
+        """
+        Show a new model, the mesh buffers are rebuilt, the render pipeline is kept
+        """
+        self.shape_model = shape_model
+        self.points = np.array(np.reshape(shape_model.mean64, [-1, 3]), dtype=np.float32)
+        self.poly = arrays_to_poly(self.points, faces)
+        self.normals = VertexNormals(faces, self.points.shape[0])
+        self.normals_buffer = np.zeros(self.points.shape, dtype=np.float32)
+        vtk_normals = numpy_to_vtk(self.normals_buffer, deep=False)
+        vtk_normals.SetName("Normals")
+        self.poly.GetPointData().SetNormals(vtk_normals)
+        self.mapper.SetInputData(self.poly)
+        self.set_sd(None)
+        # home position of the camera, as after loading a model in the viewer
+        camera = self.ren.GetActiveCamera()
+        camera.SetPosition(0, 0, 1)
+        camera.SetFocalPoint(0, 0, 0)
+        camera.SetViewUp(0, 1, 0)
+        self.ren.ResetCamera()
+        self.home = camera.GetPosition()
+
+    def set_sd(self, sd=None):
+        """
+        :param sd: sd vector, None for the mean shape
+        """
+        if sd is None:
+            np.copyto(self.points, np.reshape(self.shape_model.mean, [-1, 3]), casting='same_kind')
+        else:
+            sd = np.asarray(sd, dtype=float)[:self.shape_model.weights.shape[0]]
+            self.shape_model.reconstruct_batch(sd[None, :], out=self.points[None])
+        self.normals.compute(self.points, self.normals_buffer)
+        self.poly.GetPoints().Modified()
+        self.poly.GetPointData().GetNormals().Modified()
+
+    def set_view(self, view):
+        """
+        :param view: one of '+x', '-x', '+y', '-y', '+z', '-z'
+        """
+        axis, i = OffscreenRenderer.views[view]
+        camera = self.ren.GetActiveCamera()
+        camera.SetPosition(self.home)
+        if axis == 'x':
+            camera.SetViewUp((i, 0, 0))
+        elif axis == 'y':
+            camera.SetViewUp((0, i, 0))
+        else:
+            camera.SetViewUp((0, 1, 0))
+            camera.Azimuth(90)
+            camera.SetViewUp((0, 0, i))
+        self.ren.ResetCamera()
+
+    def snapshot(self, filename, view=None):
+        if view is not None:
+            self.set_view(view)
+        self.window.Render()
+        self.image.Modified()
+        self.writer.SetFileName(filename)
+        self.writer.Write()
+        return filename
+
+    def close(self):
+        self.window.Finalize()
+
+
+def read_sd_csv(filename):
+    """
+    One sd vector per row, an optional header row is skipped
+    :return: (M x K) array
+    """
+    rows = []
+    with open(filename) as f:
+        for line in f:
+            values = [v.strip() for v in line.split(',') if v.strip()]
+            if not values:
+                continue
+            try:
+                rows.append([float(v) for v in values])
+            except ValueError:
+                if rows:
+                    raise
+    k = max((len(r) for r in rows), default=0)
+    sds = np.zeros([len(rows), k])
+    for i, r in enumerate(rows):
+        sds[i, :len(r)] = r
+    return sds
+
+
+def model_name(ssm_file):
+    return os.path.splitext(os.path.basename(ssm_file))[0]
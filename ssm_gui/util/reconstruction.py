@@ -0,0 +1,121 @@
+import threading
+import time
+
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+
+
+class ReconstructionThread(QThread):
+    """
+    Double buffered reconstruction of the latest submitted sd vector, off the GUI thread
+    """
+    reconstructed = Signal()
+    names = ['points', 'scalars', 'normals']
+
+    def __init__(self, engine, back=None):
+        super().__init__()
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.swap_lock = threading.Lock()     # held while the back buffers are written
+        self.request = None
+        self.running = True
+        self.engines = [engine, engine.copy() if back is None else back]
+        n = engine.buffer.shape[0]
+        self.buffers = {
+            'points': [e.buffer for e in self.engines],
+            'scalars': [np.zeros(n, dtype=np.float32) for i in range(2)],
+            'normals': [np.zeros([n, 3], dtype=np.float32) for i in range(2)],
+        }
+        self.current = {name: 0 for name in ReconstructionThread.names}     # index of each front buffer
+        self.stale = [False, False]     # engines whose buffer was written by someone else
+        self.fresh = []         # names of the back buffers holding the latest frame
+        self.scalars = None     # optional DisplacementScalars, computed in the same pass as the vertices
+        self.normals = None     # optional VertexNormals, also computed in the same pass
+        self.has_ready = False
+        self.elapsed = 0.0      # msec spent on the last reconstruction
+
+    def front(self):
+        """
+        :return: dict of the front buffers by name
+        """
+        return {name: self.buffers[name][self.current[name]] for name in ReconstructionThread.names}
+
+    def invalidate(self):
+        """
+        The front vertex buffer was written outside its engine, e.g. by a sweep
+        """
+        with self.lock:
+            self.stale[self.current['points']] = True
+
+    def set_scalars(self, scalars):
+        if scalars is not None:
+            scalars = scalars.copy()
+        with self.lock:
+            self.scalars = scalars
+
+    def set_normals(self, normals):
+        if normals is not None:
+            normals = normals.copy()
+        with self.lock:
+            self.normals = normals
+
+    def submit(self, sd):
+        with self.condition:
+            self.request = np.array(sd, dtype=float)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.request is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                sd = self.request
+                self.request = None
+            st = time.perf_counter()
+            with self.swap_lock:
+                back = {name: 1 - self.current[name] for name in ReconstructionThread.names}
+                i = back['points']
+                with self.lock:
+                    scalars, normals = self.scalars, self.normals
+                    stale = self.stale[i]
+                    self.stale[i] = False
+                engine = self.engines[i]
+                if stale:
+                    engine.reset(sd)
+                else:
+                    engine.update_sd(sd)
+                self.fresh = ['points']
+                if scalars is not None:
+                    scalars.compute(engine.buffer, self.buffers['scalars'][back['scalars']])
+                    self.fresh.append('scalars')
+                if normals is not None:
+                    normals.compute(engine.buffer, self.buffers['normals'][back['normals']])
+                    self.fresh.append('normals')
+                self.has_ready = True
+            self.elapsed = 1000.0 * (time.perf_counter() - st)
+            self.reconstructed.emit()
+
+    def take(self):
+        """
+        Swap the latest frame to the front, the previous front buffers go back to the thread
+        :return: dict of the swapped front buffers, None if there is no finished frame
+        """
+        if not self.swap_lock.acquire(blocking=False):
+            return None
+        try:
+            if not self.has_ready:
+                return None
+            for name in self.fresh:
+                self.current[name] = 1 - self.current[name]
+            self.has_ready = False
+            return {name: self.buffers[name][self.current[name]] for name in self.fresh}
+        finally:
+            self.swap_lock.release()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.wait()
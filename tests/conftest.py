@@ -0,0 +1,14 @@
+import importlib.util
+import sys
+import time
+import types
+
+# the models only use ptb for timing, stand in for it where it is not installed so the tests still run
+if importlib.util.find_spec("ptb") is None:
+    lang = types.ModuleType("ptb.util.lang")
+    lang.milli = lambda: int(time.time() * 1000)
+    util = types.ModuleType("ptb.util")
+    util.lang = lang
+    ptb = types.ModuleType("ptb")
+    ptb.util = util
+    sys.modules.update({"ptb": ptb, "ptb.util": util, "ptb.util.lang": lang})
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import vtk
+
+from ssm_gui.models.cache import MeshCache, ShapeModelCache
+from ssm_gui.models.mesh import poly_to_arrays
+from ssm_gui.models.shape import ShapeModel
+
+
+def save_model(filename, n=300, k=8, seed=0):
+    rng = np.random.default_rng(seed)
+    modes, _ = np.linalg.qr(rng.normal(size=(3 * n, k)))
+    np.savez(filename, mean=rng.normal(size=3 * n), weights=np.linspace(8.0, 1.0, k), modes=modes)
+
+
+def write_sphere(filename, resolution=16, centre=(0, 0, 0)):
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(resolution)
+    source.SetPhiResolution(resolution)
+    source.SetCenter(*centre)
+    writer = vtk.vtkPLYWriter()
+    writer.SetFileName(filename)
+    writer.SetInputConnection(source.GetOutputPort())
+    writer.SetFileTypeToBinary()
+    writer.Write()
+
+
+def test_model_cache_memory_maps_and_rebuilds(tmp_path):
+    pc = str(tmp_path / "model.pc.npz")
+    save_model(pc)
+    uncached = ShapeModel(pc, use_cache=False)
+    assert not os.path.exists(pc + ".cache")
+    model = ShapeModel(pc)
+    assert ShapeModelCache(pc).is_valid()
+    assert isinstance(ShapeModel(pc).scaled_modes64, np.memmap)
+    np.testing.assert_allclose(model.reconstruct_batch(np.ones([1, 8])), uncached.reconstruct_batch(np.ones([1, 8])))
+    save_model(pc, seed=1)      # a changed source invalidates the sidecar
+    np.testing.assert_allclose(ShapeModel(pc).mean, ShapeModel(pc, use_cache=False).mean)
+
+
+def test_mesh_cache_round_trip(tmp_path):
+    filename = str(tmp_path / "sphere.ply")
+    write_sphere(filename)
+    cache = MeshCache(str(tmp_path / "cache"))
+    first = cache.load(filename)
+    second = cache.load(filename)
+    assert isinstance(second['points'], np.memmap)
+    points, faces = poly_to_arrays(cache.poly(filename))
+    reader = vtk.vtkPLYReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    expected_points, expected_faces = poly_to_arrays(reader.GetOutput())
+    np.testing.assert_array_equal(points, expected_points)
+    np.testing.assert_array_equal(faces, expected_faces)
+    np.testing.assert_array_equal(first['normals'], second['normals'])
+
+
+def test_mesh_cache_evicts_least_recently_used(tmp_path):
+    cache = MeshCache(str(tmp_path / "cache"), max_bytes=None)
+    filenames = [str(tmp_path / "sphere{0}.ply".format(i)) for i in range(3)]
+    for i, filename in enumerate(filenames):
+        write_sphere(filename, centre=(i, 0, 0))     # same topology, different content
+        cache.load(filename)
+    meshes = [os.path.join(cache.root, cache.lookup(f)) for f in filenames]
+    for i, path in enumerate(meshes):
+        os.utime(os.path.join(path, 'done'), ns=(i * 10 ** 9, i * 10 ** 9))
+    sizes = {path: size for used, size, path in cache.entries()}
+    cache.max_bytes = sum(sizes.values()) - 1
+    cache.evict()
+    assert not os.path.exists(meshes[0])
+    assert all(os.path.exists(path) for path in meshes[1:])
+    # the shared topology can be evicted on its own, it is rebuilt on the next load
+    cache.max_bytes = 0
+    cache.evict(keep=meshes[1:])
+    assert len(cache.entries()) == 2
+    mesh = cache.load(filenames[1])
+    assert 'incident' in mesh
+    cache.load(filenames[0])
+    assert os.path.exists(meshes[0])
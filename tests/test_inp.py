@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from ssm_gui.models.inp import InpWriter, write_inp
+
+
+def sections(filename):
+    """
+    :return: list of (keyword line, data lines) in file order
+    """
+    ret = []
+    with open(filename) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("**"):
+                continue
+            if line.startswith("*"):
+                ret.append((line, []))
+            else:
+                ret[-1][1].append(line)
+    return ret
+
+
+def rows(lines):
+    return [[v.strip() for v in line.split(",")] for line in lines]
+
+
+@pytest.mark.parametrize('chunk_size', [2 ** 16, 3])
+def test_inp_writer(tmp_path, chunk_size):
+    filename = str(tmp_path / "femur.inp")
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(11, 3))
+    faces = rng.integers(0, 11, size=(7, 3))
+    head = np.zeros(11, dtype=bool)
+    head[[0, 4, 5]] = True
+    with InpWriter(filename, "femur", chunk_size=chunk_size) as inp:
+        inp.add_part("femur", points, faces, node_sets={'head': head, 'all': np.arange(11)},
+                     element_sets={'top': [6]})
+    s = sections(filename)
+    assert [k for k, d in s] == ["*Heading", "*Part, name=femur", "*Node", "*Element, type=S3", "*Nset, nset=head",
+                                 "*Nset, nset=all", "*Elset, elset=top", "*End Part", "*Assembly, name=Assembly",
+                                 "*Instance, name=femur-1, part=femur", "*End Instance", "*End Assembly"]
+    nodes = np.array(rows(s[2][1]), dtype=float)
+    np.testing.assert_array_equal(nodes[:, 0], np.arange(1, 12))
+    np.testing.assert_allclose(nodes[:, 1:], points, rtol=1e-11)
+    elements = np.array(rows(s[3][1]), dtype=int)
+    np.testing.assert_array_equal(elements[:, 0], np.arange(1, 8))
+    np.testing.assert_array_equal(elements[:, 1:], faces + 1)
+    assert rows(s[4][1]) == [["1", "5", "6"]]
+    assert rows(s[5][1]) == [[str(i) for i in range(1, 12)]]
+    assert rows(s[6][1]) == [["7"]]
+
+
+def test_write_inp_parts_and_set_lines(tmp_path):
+    filename = str(tmp_path / "bones.inp")
+    quad = (np.zeros([40, 3]), np.arange(40).reshape([10, 4]), {'all': np.arange(40)})
+    write_inp(filename, [("a", np.ones([3, 3]), np.array([[0, 1, 2]])), ("b",) + quad])
+    s = sections(filename)
+    keywords = [k for k, d in s]
+    assert keywords.count("*End Part") == 2
+    assert "*Element, type=S4" in keywords
+    assert "*Instance, name=a-1, part=a" in keywords and "*Instance, name=b-1, part=b" in keywords
+    set_lines = s[keywords.index("*Nset, nset=all")][1]
+    assert [len(r) for r in rows(set_lines)] == [16, 16, 8]
+
+
+def test_inp_writer_no_assembly_after_error(tmp_path):
+    filename = str(tmp_path / "broken.inp")
+    with pytest.raises(KeyError):
+        with InpWriter(filename) as inp:
+            inp.add_part("bad", np.zeros([5, 3]), np.zeros([1, 5], dtype=int))     # no element type for 5 nodes
+    with open(filename) as f:
+        assert "*Assembly" not in f.read()
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+import vtk
+from vtkmodules.util.numpy_support import vtk_to_numpy
+
+from ssm_gui.models.mesh import (VertexNormals, barycentric_transfer, poly_to_arrays, read_poly, read_ply_arrays,
+                                 read_stl_arrays, surface_distance)
+
+
+def sphere(resolution=24):
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(resolution)
+    source.SetPhiResolution(resolution)
+    source.Update()
+    poly = vtk.vtkPolyData()
+    poly.SetPoints(source.GetOutput().GetPoints())
+    poly.SetPolys(source.GetOutput().GetPolys())     # no point data
+    return poly
+
+
+def reference_normals(points, faces):
+    face_normals = np.cross(points[faces[:, 1]] - points[faces[:, 0]], points[faces[:, 2]] - points[faces[:, 0]])
+    normals = np.zeros(points.shape)
+    for j in range(3):
+        np.add.at(normals, faces[:, j], face_normals)
+    length = np.linalg.norm(normals, axis=1)
+    length[length == 0] = 1.0
+    return normals / length[:, None]
+
+
+def vtk_read(reader, filename):
+    reader.SetFileName(filename)
+    reader.Update()
+    return poly_to_arrays(reader.GetOutput())
+
+
+def test_vertex_normals_match_reference():
+    points, faces = poly_to_arrays(sphere())
+    rng = np.random.default_rng(0)
+    points = points + rng.normal(scale=0.01, size=points.shape)
+    faces = faces[1:]     # leaves the first vertices of the first face less covered
+    normals = VertexNormals(faces, points.shape[0] + 2)     # two unused vertices
+    points = np.concatenate([points, np.zeros([2, 3])])
+    out = normals.compute(points, np.empty(points.shape, dtype=np.float32))
+    np.testing.assert_allclose(out, reference_normals(points, faces), atol=1e-6)
+    assert np.all(out[-2:] == 0)
+
+
+def test_ply_reader_matches_vtk(tmp_path):
+    filename = str(tmp_path / "sphere.ply")
+    writer = vtk.vtkPLYWriter()
+    writer.SetFileName(filename)
+    writer.SetInputData(sphere())
+    writer.SetFileTypeToBinary()
+    writer.Write()
+    arrays = read_ply_arrays(filename)
+    assert arrays is not None
+    points, faces = vtk_read(vtk.vtkPLYReader(), filename)
+    np.testing.assert_array_equal(arrays[0], points)
+    np.testing.assert_array_equal(arrays[1], faces)
+
+
+def test_ply_with_colours_uses_vtk(tmp_path):
+    filename = str(tmp_path / "coloured.ply")
+    poly = sphere()
+    colours = vtk.vtkUnsignedCharArray()
+    colours.SetName("RGB")
+    colours.SetNumberOfComponents(3)
+    for i in range(poly.GetNumberOfPoints()):
+        colours.InsertNextTuple3(i % 256, 0, 255)
+    poly.GetPointData().SetScalars(colours)
+    writer = vtk.vtkPLYWriter()
+    writer.SetFileName(filename)
+    writer.SetInputData(poly)
+    writer.SetArrayName("RGB")
+    writer.SetFileTypeToBinary()
+    writer.Write()
+    assert read_ply_arrays(filename) is None
+    scalars = read_poly(filename).GetPointData().GetScalars()
+    assert scalars is not None
+    np.testing.assert_array_equal(vtk_to_numpy(scalars), vtk_to_numpy(colours))
+
+
+def write_stl(filename, triangles):
+    record = np.dtype([('normal', '<f4', (3,)), ('v', '<f4', (3, 3)), ('attribute', '<u2')])
+    block = np.zeros(triangles.shape[0], dtype=record)
+    block['v'] = triangles
+    with open(filename, 'wb') as f:
+        f.write(b'\0' * 80)
+        f.write(np.uint32(triangles.shape[0]).tobytes())
+        f.write(block.tobytes())
+
+
+@pytest.mark.parametrize('signed_zero', [False, True])
+def test_stl_reader_matches_vtk(tmp_path, signed_zero):
+    filename = str(tmp_path / "sphere.stl")
+    points, faces = poly_to_arrays(sphere())
+    triangles = points[faces].astype(np.float32)
+    if signed_zero:
+        triangles[triangles == 0] = -0.0
+        triangles[::2][triangles[::2] == 0] = 0.0
+    write_stl(filename, triangles)
+    arrays = read_stl_arrays(filename)
+    assert arrays is not None
+    points, faces = vtk_read(vtk.vtkSTLReader(), filename)
+    assert arrays[0].shape == points.shape
+    np.testing.assert_array_equal(arrays[0], points)
+    np.testing.assert_array_equal(arrays[1], faces)
+
+
+def test_stl_reader_drops_degenerate_facets(tmp_path):
+    filename = str(tmp_path / "degenerate.stl")
+    points, faces = poly_to_arrays(sphere())
+    triangles = points[faces].astype(np.float32)
+    triangles[5, 1] = triangles[5, 0]
+    triangles[9, 2] = triangles[9, 1]
+    write_stl(filename, triangles)
+    arrays = read_stl_arrays(filename)
+    points, faces = vtk_read(vtk.vtkSTLReader(), filename)
+    assert arrays[1].shape[0] == faces.shape[0] == triangles.shape[0] - 2
+    np.testing.assert_array_equal(arrays[0], points)
+    np.testing.assert_array_equal(arrays[1], faces)
+
+
+def test_barycentric_transfer_locates_surface_points():
+    points, faces = poly_to_arrays(sphere())
+    rng = np.random.default_rng(1)
+    cells = rng.integers(faces.shape[0], size=200)
+    weights = rng.dirichlet(np.ones(3), size=200)
+    targets = np.einsum('mj,mji->mi', weights, points[faces[cells]])
+    targets[:20] *= 1.5     # off the surface, located through the cell locator
+    indices, found = barycentric_transfer(points, faces, targets)
+    np.testing.assert_allclose(found.sum(axis=1), 1.0)
+    located = np.einsum('mj,mji->mi', found, points[indices])
+    np.testing.assert_allclose(located[20:], targets[20:], atol=1e-9)
+    distances = surface_distance(points, faces, targets[:20])
+    np.testing.assert_allclose(np.linalg.norm(located[:20] - targets[:20], axis=1), distances, atol=1e-6)
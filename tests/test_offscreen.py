@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import vtk
+from vtkmodules.util.numpy_support import vtk_to_numpy
+
+from ssm_gui.models.mesh import poly_to_arrays
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.util.offscreen import OffscreenRenderer, read_sd_csv
+
+
+def sphere_model(k=3, seed=0):
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(24)
+    source.SetPhiResolution(24)
+    source.Update()
+    points, faces = poly_to_arrays(source.GetOutput())
+    rng = np.random.default_rng(seed)
+    modes, _ = np.linalg.qr(rng.normal(size=(points.size, k)))
+    return ShapeModel.from_arrays(points.ravel(), np.full(k, 1e-3), modes, precision='float32'), faces
+
+
+def read_png(filename):
+    reader = vtk.vtkPNGReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    image = reader.GetOutput()
+    width, height, _ = image.GetDimensions()
+    return vtk_to_numpy(image.GetPointData().GetScalars()).reshape([height, width, -1])
+
+
+def test_offscreen_renderer(tmp_path):
+    shape_model, faces = sphere_model()
+    renderer = OffscreenRenderer(64, 48, background=(0, 0, 0))
+    renderer.set_model(shape_model, faces)
+    sd = np.array([2.0, -1.0, 0.5, 7.0])     # extra values are ignored
+    renderer.set_sd(sd)
+    np.testing.assert_allclose(renderer.points, shape_model.reconstruct_batch(sd[None, :3])[0], atol=1e-6)
+    assert np.shares_memory(vtk_to_numpy(renderer.poly.GetPoints().GetData()), renderer.points)
+    pixels = [read_png(renderer.snapshot(str(tmp_path / name), v)) for name, v in (('px.png', '+x'), ('mz.png', '-z'))]
+    renderer.set_sd(None)
+    np.testing.assert_allclose(renderer.points, np.reshape(shape_model.mean, [-1, 3]))
+    renderer.close()
+    for p in pixels:
+        assert p.shape == (48, 64, 3)
+        assert np.any(p > 0)    # the mesh covers part of the black background
+        assert np.any(p == 0)
+
+
+def test_read_sd_csv(tmp_path):
+    filename = tmp_path / "sd.csv"
+    filename.write_text("PC1,PC2,PC3\n1,2,3\n\n-1,0.5\n")
+    np.testing.assert_array_equal(read_sd_csv(str(filename)), [[1, 2, 3], [-1, 0.5, 0]])
+    filename.write_text("PC1,PC2\n")
+    assert read_sd_csv(str(filename)).shape == (0, 0)
+    filename.write_text("1,2\n1,x\n")
+    with pytest.raises(ValueError):
+        read_sd_csv(str(filename))
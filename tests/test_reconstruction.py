@@ -0,0 +1,50 @@
+import time
+
+import numpy as np
+
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.util.reconstruction import ReconstructionThread
+
+
+def random_model(n=300, k=8, seed=0):
+    rng = np.random.default_rng(seed)
+    modes, _ = np.linalg.qr(rng.normal(size=(3 * n, k)))
+    return ShapeModel.from_arrays(rng.normal(size=3 * n), np.linspace(8.0, 1.0, k), modes)
+
+
+def next_frame(worker, timeout=5.0):
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        buffers = worker.take()
+        if buffers is not None:
+            return buffers
+        time.sleep(0.001)
+    raise TimeoutError
+
+
+def test_double_buffered_reconstruction():
+    model = random_model()
+    worker = ReconstructionThread(model.incremental())
+    first = worker.front()['points']
+    worker.start()
+    try:
+        rng = np.random.default_rng(1)
+        sd = np.zeros(8)
+        shown = []
+        for i in range(6):
+            sd[i % 8] = rng.uniform(-3, 3)
+            worker.submit(sd)
+            buffers = next_frame(worker)
+            assert buffers['points'] is worker.front()['points']
+            np.testing.assert_allclose(buffers['points'], model.reconstruct_batch(sd)[0], atol=1e-9)
+            shown.append(buffers['points'])
+        assert shown[0] is not first and shown[1] is first      # the two buffers alternate
+        # the front buffer is overwritten (e.g. by a sweep frame), its engine recomputes in full
+        buffers['points'][:] = 0
+        worker.invalidate()
+        for i in range(2):
+            sd[0] += 0.5
+            worker.submit(sd)
+            np.testing.assert_allclose(next_frame(worker)['points'], model.reconstruct_batch(sd)[0], atol=1e-9)
+    finally:
+        worker.stop()
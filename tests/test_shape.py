@@ -0,0 +1,181 @@
+import numpy as np
+import pytest
+import vtk
+
+from ssm_gui.models.shape import ShapeModel
+from ssm_gui.models import ssmb
+from ssm_gui.models.mesh import poly_to_arrays
+
+
+def random_model(n=500, k=12, seed=0):
+    rng = np.random.default_rng(seed)
+    modes, _ = np.linalg.qr(rng.normal(size=(3 * n, k)))
+    return ShapeModel.from_arrays(rng.normal(size=3 * n) * 10.0, np.linspace(9.0, 1.0, k), modes)
+
+
+def test_project_inverts_reconstruct_diff_all():
+    model = random_model()
+    rng = np.random.default_rng(1)
+    sds = rng.uniform(-3, 3, size=(5, model.weights.shape[0]))
+    shapes = np.stack([model.reconstruct_diff_all(sd, True) for sd in sds])
+    fitted, residuals = model.project(shapes, chunk_size=2)
+    np.testing.assert_allclose(fitted, sds, atol=1e-9)
+    assert np.all(residuals < 1e-9)
+
+
+def test_project_residual_of_shape_off_the_span():
+    model = random_model()
+    rng = np.random.default_rng(2)
+    offset = rng.normal(size=model.mean.shape[0])
+    modes = model.mode_matrix()
+    offset -= modes @ (modes.T @ offset)     # orthogonal to every mode
+    shape = model.reconstruct_diff_all(np.ones(model.weights.shape[0]), True) + np.reshape(offset, [-1, 3])
+    fitted, residuals = model.project(shape)
+    np.testing.assert_allclose(fitted[0], 1.0, atol=1e-9)
+    assert residuals[0] == pytest.approx(np.linalg.norm(offset), rel=1e-9)
+
+
+@pytest.mark.parametrize('precision', ['float64', 'float32'])
+def test_incremental_matches_full_reconstruction(precision):
+    model = random_model()
+    model.set_precision(precision)
+    engine = model.incremental(refresh_every=1000)
+    rng = np.random.default_rng(3)
+    k = model.weights.shape[0]
+    for i in range(500):
+        engine.update(int(rng.integers(k)), rng.uniform(-3, 3))
+    engine.update_sd(rng.uniform(-3, 3, size=k))
+    full = model.reconstruct_diff_all(engine.sd.astype(np.float64), True, precision='float64')
+    tolerance = 1e-9 if precision == 'float64' else 1e-3
+    np.testing.assert_allclose(engine.buffer, np.reshape(full, [-1, 3]), atol=tolerance)
+
+
+def test_ssmb_round_trip_within_reported_error(tmp_path):
+    model = random_model(n=2000, k=20)
+    filename = str(tmp_path / "model.ssmb")
+    error = model.save_ssmb(filename, sd_range=3.0)
+    loaded = ShapeModel(filename)
+    assert isinstance(loaded.scaled_modes64, ssmb.QuantizedModes)
+    np.testing.assert_allclose(loaded.weights, model.weights)
+    rng = np.random.default_rng(4)
+    sds = rng.uniform(-3, 3, size=(8, model.weights.shape[0]))
+    sds[0] = 3.0
+    sds[1] = -3.0
+    expected = model.reconstruct_batch(sds)
+    actual = loaded.reconstruct_batch(sds)
+    deviation = np.linalg.norm(actual - expected, axis=2)
+    assert deviation.max() <= error['max_error_all_modes'] + error['max_error_mean']
+
+
+def test_ssmb_incremental_matches_full_reconstruction(tmp_path):
+    filename = str(tmp_path / "model.ssmb")
+    model = random_model()
+    model.save_ssmb(filename)
+    quantized = ShapeModel(filename)
+    quantized.scaled_modes64.block_bytes = 2 ** 12     # dequantized over several blocks
+    engine = quantized.incremental(refresh_every=1000)
+    rng = np.random.default_rng(5)
+    for i in range(300):
+        engine.update(int(rng.integers(model.weights.shape[0])), rng.uniform(-3, 3))
+    full = quantized.reconstruct_diff_all(engine.sd, True)
+    np.testing.assert_allclose(engine.buffer, np.reshape(full, [-1, 3]), atol=1e-9)
+
+
+@pytest.mark.parametrize('copy', [False, True])
+def test_iter_reconstruct_batch_matches_reconstruct_batch(copy):
+    model = random_model()
+    rng = np.random.default_rng(6)
+    sds = rng.uniform(-3, 3, size=(10, model.weights.shape[0]))
+    chunks = [(i, chunk if copy else chunk.copy()) for i, chunk in model.iter_reconstruct_batch(sds, 4, copy=copy)]
+    assert [i for i, chunk in chunks] == [0, 4, 8]
+    np.testing.assert_allclose(np.concatenate([chunk for i, chunk in chunks]), model.reconstruct_batch(sds))
+    first, second = [chunk for i, chunk in model.iter_reconstruct_batch(sds, 4, copy=copy)][:2]
+    assert np.shares_memory(first, second) != copy
+
+
+def test_number_of_modes():
+    weights = np.array([5.0, 3.0, 1.0, 1.0])
+    assert ShapeModel.number_of_modes(weights) == 4
+    assert ShapeModel.number_of_modes(weights, n_modes=2) == 2
+    assert ShapeModel.number_of_modes(weights, n_modes=10) == 4
+    assert ShapeModel.number_of_modes(weights, variance=0.5) == 1
+    assert ShapeModel.number_of_modes(weights, variance=0.8) == 2
+    assert ShapeModel.number_of_modes(weights, variance=0.85) == 3
+    assert ShapeModel.number_of_modes(weights, n_modes=1, variance=0.85) == 1
+
+
+def test_truncated_model_matches_leading_modes(tmp_path):
+    model = random_model()
+    pc = str(tmp_path / "model.pc.npz")
+    np.savez(pc, mean=model.mean, weights=model.weights, modes=model.modes)
+    truncated = ShapeModel(pc, n_modes=5)
+    assert truncated.weights.shape[0] == truncated.scaled_modes.shape[0] == 5
+    assert truncated.total_modes == model.weights.shape[0]
+    sd = np.linspace(-2, 2, 5)
+    np.testing.assert_allclose(truncated.reconstruct_diff_all(sd, True), model.reconstruct_diff_all(sd, True))
+    variance = ShapeModel(pc, variance=0.5)
+    k = variance.weights.shape[0]
+    assert variance.explained_variance >= 0.5 > np.sum(model.weights[:k - 1]) / np.sum(model.weights)
+
+
+def test_decimate_error_ignores_unreferenced_vertices():
+    source = vtk.vtkSphereSource()
+    source.SetRadius(10.0)
+    source.SetThetaResolution(40)
+    source.SetPhiResolution(40)
+    source.Update()
+    points, faces = poly_to_arrays(source.GetOutput())
+    rng = np.random.default_rng(7)
+    points = np.concatenate([points, rng.normal(scale=50.0, size=(100, 3))])    # not used by any face
+    modes, _ = np.linalg.qr(rng.normal(size=(points.size, 4)))
+    model = ShapeModel.from_arrays(points.ravel(), np.full(4, 1e-4), modes)
+    reduced, reduced_faces, error = model.decimate(faces, 0.8, n_samples=2, seed=0)
+    assert reduced_faces.shape[0] < 0.3 * faces.shape[0]
+    assert reduced.weights.shape[0] == 4
+    assert error['max_error_mean'] < 0.5
+    assert error['max_error'] < 0.5
+
+
+def test_extract_region_keeps_the_region_covariance():
+    model = random_model(n=200, k=6)
+    faces = np.array([[0, 1, 2], [2, 3, 4], [4, 5, 150], [10, 11, 12]])
+    ids = np.concatenate([np.arange(20), np.arange(100, 120)])
+    region, region_faces = model.extract_region(ids, faces)
+    np.testing.assert_array_equal(region_faces, [[0, 1, 2], [2, 3, 4], [10, 11, 12]])
+    np.testing.assert_allclose(np.reshape(region.mean, [-1, 3]), np.reshape(model.mean, [-1, 3])[ids])
+    np.testing.assert_allclose(region.modes.T @ region.modes, np.eye(region.weights.shape[0]), atol=1e-12)
+    assert np.all(np.diff(region.weights) <= 0)
+    sliced = model.scaled_modes[:, ids].reshape([6, -1])
+    scaled = region.scaled_modes.reshape([region.weights.shape[0], -1])
+    np.testing.assert_allclose(scaled.T @ scaled, sliced.T @ sliced, atol=1e-9)
+
+
+@pytest.mark.parametrize('max_radius', [None, 2.0])
+def test_generate_cohort(tmp_path, max_radius):
+    model = random_model(n=100)
+    shapes_file, sd_file = model.generate_cohort(50, str(tmp_path / "cohort"), block_size=16, seed=8,
+                                                 max_radius=max_radius, n_modes=4)
+    shapes = np.load(shapes_file)
+    sds = np.load(sd_file)
+    assert shapes.shape == (50, 100, 3) and shapes.dtype == np.float32
+    assert sds.shape == (50, 4)
+    np.testing.assert_allclose(shapes, model.reconstruct_batch(sds), atol=1e-4)
+    if max_radius is not None:
+        assert np.all(np.linalg.norm(sds, axis=1) <= max_radius)
+    again = [sds for start, sds in model.sample(50, 16, seed=8, max_radius=max_radius, n_modes=4)]
+    np.testing.assert_array_equal(np.concatenate(again), sds)
+
+
+def test_sample_radius_too_small():
+    with pytest.raises(ValueError):
+        list(random_model().sample(10, seed=0, max_radius=0.01, max_tries=5))
+
+
+def test_generate_cohort_h5(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    model = random_model(n=100)
+    filename = str(tmp_path / "cohort.h5")
+    model.generate_cohort(20, filename, block_size=8, seed=9, chunk_bytes=1024)
+    with h5py.File(filename, "r") as f:
+        assert f['shapes'].chunks[0] == 1
+        np.testing.assert_allclose(f['shapes'][:], model.reconstruct_batch(f['sd'][:]), atol=1e-4)